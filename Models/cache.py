@@ -0,0 +1,148 @@
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from copy import deepcopy
+
+class LRUCache:
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Return the cached value and mark it most recently used."""
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entry when full."""
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        """Hit/miss counters and current size."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries), "maxsize": self.maxsize}
+
+class AnswerCache(LRUCache):
+    """LRU cache of query answers, each stamped with the data versions it was computed from.
+
+    An entry is dropped on lookup when the stamp no longer matches (the data changed) or,
+    with a ttl in seconds, when it is older than that.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        super().__init__(maxsize)
+        self.ttl = ttl
+        self.clock = clock
+        self.stale = 0
+        self.expired = 0
+
+    def get(self, key, stamp, default=None):
+        entry = self.entries.get(key)
+        if entry is not None:
+            entry_stamp, expires, value = entry
+            if entry_stamp != stamp:
+                self.stale += 1
+                del self.entries[key]
+            elif expires is not None and self.clock() >= expires:
+                self.expired += 1
+                del self.entries[key]
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+        self.misses += 1
+        return default
+
+    def put(self, key, stamp, value):
+        expires = self.clock() + self.ttl if self.ttl is not None else None
+        super().put(key, (stamp, expires, value))
+
+    def stats(self):
+        return {**super().stats(), "stale": self.stale, "expired": self.expired, "ttl": self.ttl}
+
+class ParseCache:
+    """Memoize pipeline results by query text and parser fingerprint, optionally backed by sqlite.
+
+    encode and decode convert results to and from plain JSON values for the sqlite store. Results
+    go in and come out through copy, so callers may change what they put or get without touching
+    the cache. Inserts are committed to sqlite in batches of commit_size, or once commit_interval
+    seconds have passed since the last commit, and on flush() and close().
+    """
+
+    def __init__(self, fingerprint, maxsize=1024, path=None, encode=None, decode=None, copy=deepcopy,
+                 commit_size=64, commit_interval=1.0):
+        self.fingerprint = fingerprint
+        self.encode = encode or (lambda result: result)
+        self.decode = decode or (lambda data: data)
+        self.copy = copy
+        self.memory = LRUCache(maxsize)
+        self.commit_size = commit_size
+        self.commit_interval = commit_interval
+        self.pending = 0
+        self.committed = time.monotonic()
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS parses (key TEXT PRIMARY KEY, result TEXT NOT NULL)")
+            self.db.commit()
+
+    def key(self, text):
+        """Content address of a query under the current parser configuration."""
+        return hashlib.sha256(f"{self.fingerprint}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, text):
+        """Copy of the cached result for a query, from memory first and then from disk."""
+        key = self.key(text)
+        result = self.memory.get(key)
+        if result is None and self.db is not None:
+            row = self.db.execute("SELECT result FROM parses WHERE key = ?", (key,)).fetchone()
+            if row:
+                result = self.decode(json.loads(row[0]))
+                self.memory.put(key, result)
+        return self.copy(result) if result is not None else None
+
+    def put(self, text, result):
+        key = self.key(text)
+        self.memory.put(key, self.copy(result))
+        if self.db is not None:
+            self.db.execute("INSERT OR REPLACE INTO parses (key, result) VALUES (?, ?)",
+                            (key, json.dumps(self.encode(result), ensure_ascii=False)))
+            self.pending += 1
+            if self.pending >= self.commit_size or time.monotonic() - self.committed >= self.commit_interval:
+                self.flush()
+
+    def flush(self):
+        """Commit the pending inserts."""
+        if self.db is not None and self.pending:
+            self.db.commit()
+        self.pending = 0
+        self.committed = time.monotonic()
+
+    def close(self):
+        if self.db is not None:
+            self.flush()
+            self.db.close()
+            self.db = None
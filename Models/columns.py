@@ -0,0 +1,380 @@
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Version stamp of a row that has not been retracted
+ALIVE = 2 ** 31 - 1
+
+TIME_PATTERN = re.compile(r"(\d{1,2}):(\d{2})HR")
+
+def time_to_minutes(value):
+    """Minutes since midnight for a time such as 13:30HR, or -1 when it is not a time."""
+    match = TIME_PATTERN.fullmatch(value)
+    return int(match.group(1)) * 60 + int(match.group(2)) if match else -1
+
+def minutes_to_time(minutes):
+    """Time string for minutes, e.g. 13:30HR for 810."""
+    return f"{minutes // 60}:{minutes % 60:02d}HR"
+
+def copy_array(values):
+    """Writable array('i') copy of any int buffer, e.g. a memoryview of a mapped snapshot."""
+    copy = array("i")
+    copy.frombytes(memoryview(values).cast("B"))
+    return copy
+
+class StringTable:
+    """Intern strings as small integer codes shared by every table of a database."""
+
+    def __init__(self):
+        self.codes = {}
+        self.strings = []
+        self.order = None
+
+    @classmethod
+    def from_list(cls, strings, order=None):
+        """Table over already-interned strings; given order (their codes sorted by string), they are
+        found by binary search and only strings interned later go into the code dict."""
+        table = cls()
+        table.strings = strings
+        if order is None:
+            table.codes = dict(zip(strings, range(len(strings))))
+        else:
+            table.order = order
+        return table
+
+    def compact(self):
+        """Drop the code dict once the bulk of the strings is interned, finding them by binary search
+        over their codes sorted by string as in a snapshot's table; later strings go into a new dict."""
+        if self.order is None:
+            self.order = array("i", sorted(range(len(self.strings)), key=self.strings.__getitem__))
+            self.codes = {}
+
+    def intern(self, value):
+        code = self.code(value)
+        if code is None:
+            code = self.codes[value] = len(self.strings)
+            self.strings.append(value)
+        return code
+
+    def code(self, value):
+        """Code of a known string, or None when it never occurs in the data."""
+        code = self.codes.get(value)
+        if code is None and self.order is not None:
+            k = bisect_left(self.order, value, key=self.strings.__getitem__)
+            if k < len(self.order) and self.strings[self.order[k]] == value:
+                return self.order[k]
+        return code
+
+    def __getitem__(self, code):
+        return self.strings[code]
+
+# Slot of PostingLists.first for a key with no row, and for a key whose rows moved to PostingLists.many
+NO_ROW = -1
+MANY_ROWS = -2
+
+class PostingLists(Mapping):
+    """Row ids per key of one index, in load order.
+
+    Most plane codes occur in a single row of a table, and an array per key would cost far more
+    than the row itself. So an int key seen once keeps its row id in first, an array indexed by
+    code; only keys with more rows (and composite tuple keys) own an array in many.
+    """
+
+    def __init__(self):
+        self.first = array("i")
+        self.many = {}
+        self.size = 0
+
+    def add(self, key, row_id):
+        if not isinstance(key, int):
+            rows = self.many.get(key)
+            if rows is None:
+                rows = self.many[key] = array("i")
+                self.size += 1
+            rows.append(row_id)
+            return
+        first = self.first
+        if key >= len(first):
+            first.extend(array("i", [NO_ROW]) * max(key + 1 - len(first), len(first)))
+        row = first[key]
+        if row == NO_ROW:
+            first[key] = row_id
+            self.size += 1
+        elif row == MANY_ROWS:
+            self.many[key].append(row_id)
+        else:
+            # The array must be in many before first points readers to it
+            self.many[key] = array("i", (row, row_id))
+            first[key] = MANY_ROWS
+
+    def get(self, key, default=None):
+        if isinstance(key, int):
+            row = self.first[key] if 0 <= key < len(self.first) else NO_ROW
+            if row == NO_ROW:
+                return default
+            if row != MANY_ROWS:
+                return array("i", (row,))
+        return self.many.get(key, default)
+
+    def __getitem__(self, key):
+        rows = self.get(key)
+        if rows is None:
+            raise KeyError(key)
+        return rows
+
+    def __contains__(self, key):
+        return key in self.many or isinstance(key, int) and 0 <= key < len(self.first) and self.first[key] != NO_ROW
+
+    def __iter__(self):
+        for code, row in enumerate(self.first):
+            if row != NO_ROW:
+                yield code
+        for key in self.many:
+            if not isinstance(key, int):
+                yield key
+
+    def __len__(self):
+        return self.size
+
+class ColumnTable:
+    """Facts of one predicate as array('i') columns of codes, indexed by code (or code tuple for composites)."""
+
+    def __init__(self, columns, strings, composite=None):
+        self.columns = columns
+        self.strings = strings
+        self.data = {column: array("i") for column in columns}
+        self.index = {column: PostingLists() for column in columns}
+        self.composite = composite or {}
+        for name in self.composite:
+            self.index[name] = PostingLists()
+        self.minutes = array("i") if "time" in columns else None
+        self.frozen = False
+        # Version stamps per row, created on the first incremental change (until then every row is live)
+        self.born = None
+        self.died = None
+        # Last database version that changed this table
+        self.version = 0
+        self.sorted = {}
+        # (column, key) -> (tag, minutes, row ids) sorted by time, built on first range query
+        self.timed = {}
+        # Serializes writers with the numpy filter, which must not see an array resized under it
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_arrays(cls, columns, strings, data, index, minutes=None, composite=None):
+        """Wrap existing columns and indexes, e.g. read-only views of a mapped snapshot, without copying."""
+        table = cls.__new__(cls)
+        table.columns = columns
+        table.strings = strings
+        table.data = data
+        table.index = index
+        table.composite = composite or {}
+        table.minutes = minutes
+        table.frozen = True
+        table.born = None
+        table.died = None
+        table.version = 0
+        table.sorted = {}
+        table.timed = {}
+        table.lock = threading.Lock()
+        return table
+
+    def thaw(self):
+        """Copy wrapped columns into writable arrays; wrapped indexes take new posting lists as overrides."""
+        self.data = {column: copy_array(values) for column, values in self.data.items()}
+        if self.minutes is not None:
+            self.minutes = copy_array(self.minutes)
+        self.frozen = False
+
+    def stamp(self):
+        """Start tracking row versions, with every existing row live since version 0."""
+        if self.born is None:
+            # Readers test born first, so died must exist by the time they see it
+            self.died = array("i", [ALIVE]) * len(self)
+            self.born = array("i", [0]) * len(self)
+
+    def append(self, values, version=0):
+        """Append one fact given as strings, visible from version on, and index it; returns its row id.
+
+        Readers do not take the lock: every per-row array is filled before the row id is published,
+        first through len(self) (the first column, filled last) and then through the indexes.
+        """
+        with self.lock:
+            if self.frozen:
+                self.thaw()
+            if version:
+                self.stamp()
+            row_id = len(self)
+            codes = [self.strings.intern(value) for value in values]
+            if self.born is not None:
+                self.died.append(ALIVE)
+                self.born.append(version)
+            if self.minutes is not None:
+                self.minutes.append(time_to_minutes(values[self.columns.index("time")]))
+            for column, code in reversed(list(zip(self.columns, codes))):
+                self.data[column].append(code)
+            for column, code in zip(self.columns, codes):
+                self.index[column].add(code, row_id)
+            for name, columns in self.composite.items():
+                self.index[name].add(tuple(codes[self.columns.index(column)] for column in columns), row_id)
+            self.version = max(self.version, version)
+            return row_id
+
+    def retract(self, row_id, version):
+        """Hide a row from version on; readers pinned to earlier versions still see it."""
+        with self.lock:
+            self.stamp()
+            self.died[row_id] = version
+            self.version = max(self.version, version)
+
+    def live(self, row_id, version=ALIVE - 1):
+        return self.born is None or self.born[row_id] <= version < self.died[row_id]
+
+    def __len__(self):
+        return len(self.data[self.columns[0]])
+
+    def __getitem__(self, row_id):
+        return tuple(self.strings[self.data[column][row_id]] for column in self.columns)
+
+    def __iter__(self):
+        """Rows that are currently live, decoded."""
+        for row_id in range(len(self)):
+            if self.live(row_id):
+                yield self[row_id]
+
+    def sorted_keys(self, column):
+        """Codes of a column's index in string order, kept until the table changes."""
+        tag = (self.version, len(self.index[column]))
+        cached = self.sorted.get(column)
+        if cached is None or cached[0] != tag:
+            cached = self.sorted[column] = (tag, sorted(self.index[column], key=self.strings.__getitem__))
+        return cached[1]
+
+    def postings(self, column, key):
+        """Row ids whose column (or composite index) equals key, given as codes."""
+        return self.index[column].get(key, ())
+
+    def select(self, bound, version=None):
+        """Row ids matching every {column: code} pair and live at version (default: latest), in load order."""
+        return self.visible(self.filter(bound), version)
+
+    def select_many(self, bounds, version=None):
+        """Row ids for each of several {column: code} dicts, like [select(bound) for bound in bounds].
+
+        With numpy, the filters that check the same columns after their shortest posting list are
+        evaluated together: their candidate rows are concatenated and each column is compared once
+        against the per-filter codes.
+        """
+        if np is None:
+            return [self.select(bound, version) for bound in bounds]
+        results = [None] * len(bounds)
+        groups = {}
+        for k, bound in enumerate(bounds):
+            if not bound:
+                results[k] = range(len(self))
+                continue
+            row_ids, rest = self.candidates(bound)
+            if not rest or not row_ids:
+                results[k] = row_ids
+            else:
+                groups.setdefault(tuple(id(values) for values, _ in rest), []).append((k, row_ids, rest))
+        with self.lock:
+            for members in groups.values():
+                ids = np.concatenate([np.frombuffer(row_ids, dtype=np.intc) for _, row_ids, _ in members])
+                group = np.repeat(np.arange(len(members)), [len(row_ids) for _, row_ids, _ in members])
+                for j, (values, _) in enumerate(members[0][2]):
+                    codes = np.array([rest[j][1] for _, _, rest in members], dtype=np.intc)
+                    keep = np.frombuffer(values, dtype=np.intc)[ids] == codes[group]
+                    ids, group = ids[keep], group[keep]
+                ends = np.searchsorted(group, np.arange(len(members) + 1))
+                for m, (k, _, _) in enumerate(members):
+                    results[k] = ids[ends[m]:ends[m + 1]].tolist()
+        return [self.visible(row_ids, version) for row_ids in results]
+
+    def visible(self, row_ids, version=None):
+        """The row ids live at version (default: latest)."""
+        if self.born is None:
+            return row_ids
+        born, died = self.born, self.died
+        version = ALIVE - 1 if version is None else version
+        return [i for i in row_ids if born[i] <= version < died[i]]
+
+    def time_index(self, column, key):
+        """Minutes and row ids of the rows whose column (or composite) equals key, sorted by time;
+        column None covers every row. Kept until the table changes."""
+        tag = (self.version, len(self))
+        cached = self.timed.get((column, key))
+        if cached is None or cached[0] != tag:
+            row_ids = self.postings(column, key) if column else range(len(self))
+            minutes = self.minutes
+            order = sorted(row_ids, key=minutes.__getitem__)
+            cached = self.timed[column, key] = (tag, [minutes[i] for i in order], order)
+        return cached[1], cached[2]
+
+    def select_range(self, bound, low, high, version=None, extreme=None):
+        """Row ids matching bound whose time is in [low, high) minutes, in time order.
+
+        The rows come from the time index of bound's most selective column (a city, or the route
+        composite), so the cost is one bisect plus the rows in range. extreme "min" or "max" keeps
+        only the rows at the earliest or latest matching time.
+        """
+        column, key, rest = self.access(bound) if bound else (None, None, [])
+        minutes, order = self.time_index(column, key)
+        start, end = bisect_left(minutes, low), bisect_left(minutes, high)
+        positions = range(end - 1, start - 1, -1) if extreme == "max" else range(start, end)
+        born, died = self.born, self.died
+        version = ALIVE - 1 if version is None else version
+        row_ids = []
+        first = None
+        for k in positions:
+            if extreme and row_ids and minutes[k] != first:
+                break
+            i = order[k]
+            if all(values[i] == code for values, code in rest) and (born is None or born[i] <= version < died[i]):
+                first = minutes[k]
+                row_ids.append(i)
+        return row_ids[::-1] if extreme == "max" else row_ids
+
+    def access(self, bound):
+        """Index (column or composite name) and key to start a non-empty bound from, and the (values, code) checks left."""
+        for name, columns in self.composite.items():
+            if all(column in bound for column in columns):
+                bound = dict(bound)
+                bound[name] = tuple(bound.pop(column) for column in columns)
+        # Start from the shortest posting list and filter it against the other columns
+        column = min(bound, key=lambda c: len(self.postings(c, bound[c])))
+        rest = []
+        for name, key in bound.items():
+            if name == column:
+                continue
+            if name in self.composite:
+                rest.extend((self.data[c], code) for c, code in zip(self.composite[name], key))
+            else:
+                rest.append((self.data[name], key))
+        return column, bound[column], rest
+
+    def candidates(self, bound):
+        """Shortest posting list for a non-empty bound, and the (values, code) checks left for its other columns."""
+        column, key, rest = self.access(bound)
+        return self.postings(column, key), rest
+
+    def filter(self, bound):
+        if not bound:
+            return range(len(self))
+        row_ids, rest = self.candidates(bound)
+        if not rest or not row_ids:
+            return row_ids
+        if np is not None:
+            with self.lock:
+                ids = np.frombuffer(row_ids, dtype=np.intc)
+                for values, code in rest:
+                    ids = ids[np.frombuffer(values, dtype=np.intc)[ids] == code]
+                return ids.tolist()
+        return [i for i in row_ids if all(values[i] == code for values, code in rest)]
@@ -1,117 +1,583 @@
+import threading
+from itertools import islice
+from Models.cache import AnswerCache, LRUCache
+from Models.facts import airline, parse_fact
+from Models.columns import ALIVE, ColumnTable, StringTable, time_to_minutes
+from Models.metrics import METRICS
+from Models.routes import RoutePlanner, RouteStrings
+from Models.snapshot import is_fresh, load_snapshot, write_snapshot
+from Models.plan import COMPARISONS, EXTREMES, ROUTE, QueryPlan, compile_procedure, normalize_procedure, parse_condition
+
 class FlightDatabase:
-    def __init__(self, db_file):
-        self.data = {"MÁY_BAY": [], "ATIME": [], "DTIME": [], "RUN-TIME": []}
+    # Column names of each fact; MÁY_BAY gets a derived airline column
+    COLUMNS = {
+        "MÁY_BAY": ("plane", "airline"),
+        "ATIME": ("plane", "city", "time"),
+        "DTIME": ("plane", "city", "time"),
+        "RUN-TIME": ("plane", "source", "dest", "time"),
+    }
+
+    def __init__(self, db_file, plan_cache_size=256, snapshot=None, answer_cache_size=1024, answer_ttl=None,
+                 route_cache_size=128):
+        self.plans = LRUCache(plan_cache_size)
+        self.answers = AnswerCache(answer_cache_size, answer_ttl)
+        self.routes = RoutePlanner(self, route_cache_size)
+        self.mapped = None
+        # Bumped by every batch of incremental changes; queries pin the version they started at
+        self.version = 0
+        self.lock = threading.Lock()
+        # Minutes of each time string met by a range or MIN/MAX condition, by code
+        self.times = {}
+        # Open a compiled snapshot when it is up to date, otherwise parse the text and refresh it
+        if snapshot and is_fresh(snapshot, db_file) and self.load_snapshot(snapshot):
+            return
+        # Facts are stored column-wise as codes from one shared string table
+        self.strings = StringTable()
+        self.data = {pred: ColumnTable(columns, self.strings) for pred, columns in self.COLUMNS.items()}
+        self.data["RUN-TIME"] = ColumnTable(self.COLUMNS["RUN-TIME"], self.strings, {"route": ("source", "dest")})
         self.load_data(db_file)
+        self.strings.compact()
+        if snapshot:
+            self.save_snapshot(snapshot)
+
+    def load_snapshot(self, path):
+        """Map a binary snapshot written by save_snapshot; returns False when it cannot be used."""
+        loaded = load_snapshot(path, self.COLUMNS)
+        if loaded is None:
+            return False
+        self.mapped, self.strings, self.data = loaded
+        return True
+
+    def save_snapshot(self, path):
+        """Compile the loaded facts, string table and indexes into a binary snapshot at path."""
+        strings, tables = self.strings, self.data
+        if any(table.born is not None for table in tables.values()):
+            # Rebuild without retracted rows so that the snapshot holds only the current facts
+            strings = StringTable()
+            tables = {pred: ColumnTable(table.columns, strings, table.composite) for pred, table in self.data.items()}
+            for pred, table in self.data.items():
+                for row in table:
+                    tables[pred].append(row)
+        write_snapshot(strings, tables, path)
 
     def load_data(self, db_file):
-        """Load data from file."""
+        """Load data from file into the column tables and their indexes."""
         try:
             with open(db_file, "r", encoding="utf-8") as f:
                 for line in f:
-                    line = line.strip()
-                    if line.startswith("(MÁY_BAY"):
-                        self.data["MÁY_BAY"].append(line.split()[1].strip(")"))
-                    elif line.startswith("(ATIME"):
-                        parts = line.split()
-                        self.data["ATIME"].append((parts[1], parts[2], parts[3].strip(")")))
-                    elif line.startswith("(DTIME"):
-                        parts = line.split()
-                        self.data["DTIME"].append((parts[1], parts[2], parts[3].strip(")")))
-                    elif line.startswith("(RUN-TIME"):
-                        parts = line.split()
-                        self.data["RUN-TIME"].append((parts[1], parts[2], parts[3], parts[4].strip(")")))
+                    fact = self.parse_fact(line)
+                    if fact:
+                        self.add_fact(*fact)
         except FileNotFoundError:
             raise Exception("Database file not found")
 
+    parse_fact = staticmethod(parse_fact)
+
+    def add_fact(self, pred, row, version=0):
+        """Append a fact (a plane code for MÁY_BAY, a tuple otherwise) and index it."""
+        if pred == "MÁY_BAY":
+            row = (row, self.airline(row))
+        return self.data[pred].append(row, version)
+
+    def apply(self, added=(), retracted=()):
+        """Retract and append (pred, row) facts as one new version, returning it.
+
+        Queries already running keep the version they started at and never see half a batch.
+        An update is a retraction of the old fact plus an append of the new one.
+        """
+        with self.lock:
+            version = self.version + 1
+            for pred, row in retracted:
+                if pred == "MÁY_BAY":
+                    row = (row, self.airline(row))
+                table = self.data[pred]
+                codes = self.encode(dict(zip(table.columns, row)))
+                row_ids = table.select(codes, self.version) if codes is not None else ()
+                if row_ids:
+                    table.retract(row_ids[0], version)
+            for pred, row in added:
+                self.add_fact(pred, row, version)
+            self.version = version
+        return version
+
+    def append(self, pred, row):
+        return self.apply(added=[(pred, row)])
+
+    def retract(self, pred, row):
+        return self.apply(retracted=[(pred, row)])
+
+    airline = staticmethod(airline)
+
+    def encode(self, bound):
+        """Translate {column: string} into {column: code}, or None if a value never occurs."""
+        codes = {}
+        for column, value in bound.items():
+            code = self.strings.code(value)
+            if code is None:
+                return None
+            codes[column] = code
+        return codes
+
+    def lookup(self, pred, **bound):
+        """Return rows of pred whose columns equal the bound values, in load order."""
+        table = self.data[pred]
+        codes = self.encode(bound)
+        if codes is None:
+            return []
+        return [table[i] for i in table.select(codes)]
+
+    def values(self, pred, column):
+        """Distinct values of a column, straight from its index while no fact has been retracted."""
+        table = self.data[pred]
+        if table.born is None:
+            return [self.strings[code] for code in table.index[column]]
+        return list(dict.fromkeys(row[table.columns.index(column)] for row in table))
+
     def parse_condition(self, condition):
         """Parse a condition string into predicate and arguments."""
-        if not condition.startswith("(") or not condition.endswith(")"):
-            return None, []
-        content = condition[1:-1].strip()
-        parts = content.split()
-        if not parts:
-            return None, []
-        return parts[0], parts[1:]
+        return parse_condition(condition)
 
-    def query(self, procedure):
-        """Query database based on procedural form list, handling variables."""
-        if not procedure or procedure[0] not in ["PRINT-ALL"]:
-            return "Invalid query"
-        
-        if len(procedure) < 2:
-            return "Invalid query"
-        
-        conditions = procedure[2:]
-        output_var = procedure[1]
-        
-        results = set()
+    def compile(self, procedure):
+        """Return the cached QueryPlan for a procedural form, compiling it on first use.
+
+        A QueryPlan built by the processor is returned as is.
+        """
+        if isinstance(procedure, QueryPlan):
+            return procedure
+        key = normalize_procedure(procedure)
+        plan = self.plans.get(key)
+        if plan is None:
+            plan = compile_procedure(key)
+            self.plans.put(key, plan)
+        return plan
+
+    def fits(self, condition):
+        """Whether a condition is a fact with its arity; the MÁY_BAY airline column is optional."""
+        columns = self.COLUMNS.get(condition.pred)
+        if columns is None:
+            return False
+        arity = len(columns)
+        return len(condition.args) == arity or (condition.pred == "MÁY_BAY" and len(condition.args) == 1)
+
+    def constants(self, condition):
+        """{column: value} of a fact condition's constants. An airline may be given by one of its
+        plane codes, so (MÁY_BAY ?m VJ1) matches every VJ plane like (MÁY_BAY ?m VJ)."""
+        columns = self.COLUMNS[condition.pred]
+        bound = {columns[i]: value for i, value in condition.bound.items()}
+        if "airline" in bound:
+            bound["airline"] = self.airline(bound["airline"])
+        return bound
+
+    def estimate(self, condition):
+        """Upper bound on the rows a condition can match, from its most selective constant."""
+        table = self.data[condition.pred]
+        if not self.fits(condition):
+            return 0
+        sizes = [len(table.postings(column, self.strings.code(value))) for column, value in self.constants(condition).items()]
+        return min(sizes) if sizes else len(table)
+
+    def match(self, condition, extra=None, version=None, memo=None, window=None):
+        """Bindings (as codes) of a condition's variables for every fact matching its constants and extra positions.
+
+        With a memo dict (see query_many), bindings and selected rows are shared by later calls.
+        """
+        if memo is None:
+            return list(self.matches(condition, extra, version, window=window))
+        key = (condition, tuple(sorted(extra.items())) if extra else (), window)
+        bindings = memo.get(key)
+        if bindings is None:
+            bindings = memo[key] = list(self.matches(condition, extra, version, memo, window))
+        return bindings
+
+    def matches(self, condition, extra=None, version=None, memo=None, window=None):
+        """Lazy form of match, yielding one binding per matching fact.
+
+        window (low, high, extreme) restricts the fact's time to [low, high) minutes through the
+        table's time index, optionally keeping only the earliest ("min") or latest ("max") facts.
+        """
+        columns = self.COLUMNS[condition.pred]
+        table = self.data[condition.pred]
+        if not self.fits(condition):
+            return iter(())
+        bound = self.encode(self.constants(condition))
+        if bound is None:
+            return iter(())
+        if extra:
+            bound.update((columns[i], code) for i, code in extra.items())
+        key = (condition.pred, tuple(sorted(bound.items())))
+        if window:
+            key += (window,)
+        row_ids = memo.get(key) if memo is not None else None
+        if row_ids is None:
+            row_ids = table.select_range(bound, *window[:2], version, window[2]) if window else table.select(bound, version)
+            if memo is not None:
+                memo[key] = row_ids
+            if METRICS.enabled:
+                METRICS.count("rows_scanned", len(row_ids), condition.pred)
+        slots = [(var, table.data[columns[positions[0]]]) for var, positions in condition.slots.items()]
+        if all(len(positions) == 1 for positions in condition.slots.values()):
+            return ({var: values[i] for var, values in slots} for i in row_ids)
+        # A variable repeated inside the condition must take the same value at every position
+        repeated = [(table.data[columns[positions[0]]], table.data[columns[p]])
+                    for positions in condition.slots.values() for p in positions[1:]]
+        return ({var: values[i] for var, values in slots} for i in row_ids
+                if all(first[i] == other[i] for first, other in repeated))
+
+    def domain(self, condition, version=None, memo=None):
+        """Codes the single variable of a condition can take."""
+        var, positions = next(iter(condition.slots.items()))
+        table = self.data[condition.pred]
+        if not condition.bound and len(positions) == 1 and self.fits(condition) and table.born is None:
+            return table.index[self.COLUMNS[condition.pred][positions[0]]].keys()
+        return {binding[var] for binding in self.match(condition, version=version, memo=memo)}
+
+    def order(self, conditions, bound=()):
+        """Join order for conditions given already bound variables: connected conditions first, then the most selective."""
+        pending = list(conditions)
+        bound_vars = set(bound)
+        ordered = []
+        estimates = {id(condition): self.estimate(condition) for condition in pending}
+        while pending:
+            condition = min(pending, key=lambda c: (bool(bound_vars) and not bound_vars & c.slots.keys(), estimates[id(c)]))
+            pending.remove(condition)
+            ordered.append((condition, estimates[id(condition)]))
+            bound_vars.update(condition.slots)
+        return ordered
+
+    def constraints(self, conditions):
+        """Split conditions into facts, ROUTE conditions, time windows {var: (low, high)} in minutes
+        and MIN/MAX (var, "min"/"max") pairs."""
+        facts = []
+        routes = []
+        windows = {}
+        extremes = []
         for condition in conditions:
-            pred, args = self.parse_condition(condition)
-            if not pred:
-                continue
-            if pred == "MÁY_BAY" and len(args) == 1:
-                results = {p for p in self.data["MÁY_BAY"]}
-            elif pred == "MÁY_BAY" and len(args) == 2 and args[1].startswith("VJ"):
-                results = {p for p in self.data["MÁY_BAY"] if p.startswith("VJ")}
-            elif pred == "ATIME" and len(args) >= 2:
-                plane = args[0] if not args[0].startswith("?") else None
-                city = args[1] if len(args) > 1 and not args[1].startswith("?") else None
-                time = args[2] if len(args) > 2 and not args[2].startswith("?") else None
-                matching_results = []
-                if output_var == "?dest":
-                    if not plane and not time:
-                        matching_results = sorted(list({c for p, c, t in self.data["ATIME"] if (not results or p in results)}))
-                        return matching_results if matching_results else "No results found"
-                    elif plane and not time:
-                        matching_results = sorted(list({c for p, c, t in self.data["ATIME"] if plane in p }))
-                        return matching_results if matching_results else "No results found"
-                matching_planes = set(self.data["MÁY_BAY"]) if not results else results
-                if plane:
-                    matching_planes = {p for p, c, t in self.data["ATIME"] if p == plane}
-                if city:
-                    matching_planes &= {p for p, c, t in self.data["ATIME"] if c == city}
-                if time:
-                    matching_planes &= {p for p, c, t in self.data["ATIME"] if t == time}
-                results = matching_planes
-            elif pred == "DTIME" and len(args) >= 2:
-                plane = args[0] if not args[0].startswith("?") else None
-                city = args[1] if len(args) > 1 and not args[1].startswith("?") else None
-                time = args[2] if len(args) > 2 and not args[2].startswith("?") else None
-                time_var = args[2] if len(args) > 2 and args[2].startswith("?") else None
-                matching_results = []
-                if city:
-                    if time_var:
-                        matching_results = [(p, t) for p, c, t in self.data["DTIME"] if c == city and (not results or p in results)]
-                    else:
-                        matching_planes = {p for p, c, t in self.data["DTIME"] if c == city and (time is None or t == time)}
-                        results = matching_planes if not results else results & matching_planes
-                if time_var and matching_results:
-                    results = sorted(matching_results, key=lambda x: x[0])
-                    return results if results else "No results found"
-            elif pred == "RUN-TIME" and len(args) >= 2:
-                plane = args[0] if not args[0].startswith("?") else None
-                source = args[1] if len(args) > 1 and not args[1].startswith("?") else None
-                dest = args[2] if len(args) > 2 and not args[2].startswith("?") else None
-                time = args[3] if len(args) > 3 and not args[3].startswith("?") else None
-                time_var = args[3] if len(args) > 3 and args[3].startswith("?") else None
-                variable_count = sum(1 for arg in [plane, source, dest, time] if arg is None or arg.startswith("?"))
-                matching_planes = set(self.data["MÁY_BAY"]) if not results else results
-                if variable_count == 3:
-                    results = sorted([(p, s, d, t) for p, s, d, t in self.data["RUN-TIME"]])
-                    return results if results else "No results found"
-                elif time_var and plane:
-                    times = sorted(list({t for p, s, d, t in self.data["RUN-TIME"] if p == plane and (not source or s == source) and (not dest or d == dest)}))
-                    return times if times else "No results found"
+            if condition.pred in COMPARISONS:
+                var, minutes = condition.args[0], time_to_minutes(condition.args[1])
+                low, high = windows.get(var, (0, ALIVE))
+                if condition.pred == "<":
+                    high = min(high, minutes)
+                elif condition.pred == "<=":
+                    high = min(high, minutes + 1)
+                elif condition.pred == ">":
+                    low = max(low, minutes + 1)
                 else:
-                    if source:
-                        matching_planes &= {p for p, s, d, t in self.data["RUN-TIME"] if s == source}
-                    if dest:
-                        matching_planes &= {p for p, s, d, t in self.data["RUN-TIME"] if d == dest}
-                    if time:
-                        matching_planes &= {p for p, s, d, t in self.data["RUN-TIME"] if t == time}
-                    results = matching_planes
+                    low = max(low, minutes)
+                windows[var] = (low, high)
+            elif condition.pred in EXTREMES:
+                extremes.append((condition.args[0], condition.pred.lower()))
+            elif condition.pred == ROUTE:
+                routes.append(condition)
+            else:
+                facts.append(condition)
+        return facts, routes, windows, extremes
+
+    def window(self, condition, windows, extremes=()):
+        """Time window (low, high, extreme) to push into a fact's time index scan, or None."""
+        columns = self.COLUMNS[condition.pred]
+        if "time" not in columns or not self.fits(condition):
+            return None
+        var = condition.var(columns.index("time"))
+        extreme = next((kind for name, kind in extremes if name == var), None)
+        if var not in windows and extreme is None:
+            return None
+        return windows.get(var, (0, ALIVE)) + (extreme,)
+
+    def minutes(self, code, strings=None):
+        if code < 0:
+            # A route duration found by the query, coded by its RouteStrings
+            return time_to_minutes(strings[code])
+        minutes = self.times.get(code)
+        if minutes is None:
+            minutes = self.times[code] = time_to_minutes(self.strings[code])
+        return minutes
+
+    def within(self, binding, windows, strings=None):
+        return all(low <= self.minutes(binding[var], strings) < high for var, (low, high) in windows.items())
+
+    def execute(self, plan, version=None, memo=None, strings=None):
+        """Evaluate a plan's conditions as a conjunctive query, returning variable bindings.
+
+        Time windows are pushed into the time index scans of the facts that bind their variable,
+        and so are MIN/MAX when the plan has a single fact; both are also applied to the result.
+        Route texts and durations are coded by strings, the query's RouteStrings.
+        """
+        strings = strings if strings is not None else RouteStrings(self.strings)
+        facts, routes, windows, extremes = self.constraints(plan.conditions)
+        # With other facts joined in, the earliest fact overall may not survive the join
+        pushed = extremes if len(facts) == 1 and not routes else ()
+        bound_vars = set()
+        bindings = [{}]
+        for condition, estimate in self.order(facts):
+            if not bindings:
+                break
+            shared = [var for var in condition.slots if var in bound_vars]
+            if len(condition.slots) == 1 and shared:
+                # Semi-join: the condition only filters an already bound variable
+                var = shared[0]
+                domain = self.domain(condition, version, memo)
+                bindings = [binding for binding in bindings if binding[var] in domain]
+                continue
+            keys = {tuple(binding[var] for var in shared) for binding in bindings} if shared else ()
+            if shared and 4 * len(keys) < estimate:
+                # Few distinct join keys: probe the index once per key instead of matching the whole fact
+                matches = []
+                for key in keys:
+                    extra = {condition.slots[var][0]: value for var, value in zip(shared, key)}
+                    matches.extend(self.match(condition, extra, version, memo, self.window(condition, windows)))
+            else:
+                matches = self.match(condition, version=version, memo=memo, window=self.window(condition, windows, pushed))
+            bindings = hash_join(bindings, matches, shared)
+            bound_vars.update(condition.slots)
+        for condition in routes:
+            # Sources (and destinations) bound by the facts are searched once per distinct value
+            shared = [var for var in condition.slots if var in bound_vars]
+            keys = {tuple(binding[var] for var in shared) for binding in bindings}
+            matches = [match for key in keys for match in self.routes.matches(condition, dict(zip(shared, key)), version, strings)]
+            bindings = hash_join(bindings, matches, shared)
+            bound_vars.update(condition.slots)
+        if windows:
+            bindings = [binding for binding in bindings if self.within(binding, windows, strings)]
+        for var, kind in extremes:
+            if bindings:
+                best = (min if kind == "min" else max)(self.minutes(binding[var], strings) for binding in bindings)
+                bindings = [binding for binding in bindings if self.minutes(binding[var], strings) == best]
+        return bindings
+
+    def check(self, plan):
+        """Error message for a plan that cannot be run, or None."""
+        if plan.error:
+            return plan.error
+        facts = []
+        routes = []
+        for condition in plan.conditions:
+            if condition.pred in COMPARISONS:
+                if len(condition.args) != 2 or condition.var(0) is None or time_to_minutes(condition.args[1]) < 0:
+                    return "Invalid query"
+            elif condition.pred in EXTREMES:
+                if len(condition.args) != 1 or condition.var(0) is None:
+                    return "Invalid query"
+            elif condition.pred == ROUTE:
+                if len(condition.args) != 4:
+                    return "Invalid query"
+                routes.append(condition)
+            elif condition.pred in self.COLUMNS:
+                facts.append(condition)
             else:
                 return "Invalid query"
-        results = sorted(list(results))
-        
-        return results if results else "No results found"
\ No newline at end of file
+        # Every variable, including those only compared or output, must be bound by a fact or a route
+        variables = set().union(*(condition.slots for condition in facts))
+        if any(condition.var(0) is not None and condition.var(0) not in variables for condition in routes):
+            return "Invalid query"
+        variables.update(*(condition.slots for condition in routes))
+        if not variables.issuperset(set(plan.output).union(*(condition.slots for condition in plan.conditions))):
+            return "Invalid query"
+        return None
+
+    def stamp(self, plan):
+        """Versions of the tables a plan reads; its answer stays valid while they are unchanged."""
+        stamp = [self.data[condition.pred].version for condition in plan.conditions if condition.pred in self.data]
+        if any(condition.pred == ROUTE for condition in plan.conditions):
+            stamp.extend(self.routes.stamp())
+        return tuple(stamp)
+
+    def query(self, procedure):
+        """Query database based on a QueryPlan or procedural form list, handling variables.
+
+        Answers are cached by plan; cached lists are shared, so callers must not mutate them.
+        """
+        plan = self.compile(procedure)
+        error = self.check(plan)
+        if error:
+            return error
+
+        version = self.version
+        stamp = self.stamp(plan)
+        answer = self.answers.get(plan, stamp)
+        if METRICS.enabled:
+            METRICS.count("answer_cache", 1, "miss" if answer is None else "hit")
+        if answer is None:
+            with METRICS.timer("query"):
+                answer = self.answer(plan, version)
+            # A batch applied while we ran may have stamped a table past our version; don't cache that
+            if max(stamp, default=0) <= version:
+                self.answers.put(plan, stamp, answer)
+        return answer
+
+    def query_many(self, procedures):
+        """Answer a batch of QueryPlans or procedural form lists at one data version, like query() on each.
+
+        Identical plans are answered once. The filters of the remaining plans' conditions (a predicate
+        with its constant arguments) are grouped by predicate and selected together, so each distinct
+        filter is computed once and its rows and bindings are shared by every plan that uses it.
+        """
+        plans = [self.compile(procedure) for procedure in procedures]
+        version = self.version
+        answers = {}
+        pending = {}
+        for plan in dict.fromkeys(plans):
+            error = self.check(plan)
+            if error:
+                answers[plan] = error
+                continue
+            stamp = self.stamp(plan)
+            answer = self.answers.get(plan, stamp)
+            if METRICS.enabled:
+                METRICS.count("answer_cache", 1, "miss" if answer is None else "hit")
+            if answer is None:
+                pending[plan] = stamp
+            else:
+                answers[plan] = answer
+        with METRICS.timer("query_many"):
+            memo = self.select_shared(pending, version)
+            for plan, stamp in pending.items():
+                answer = answers[plan] = self.answer(plan, version, memo)
+                if max(stamp, default=0) <= version:
+                    self.answers.put(plan, stamp, answer)
+        return [answers[plan] for plan in plans]
+
+    def select_shared(self, plans, version):
+        """Memo for execute() holding the rows of every distinct constant filter in plans, selected per predicate in one call."""
+        filters = {}
+        for plan in plans:
+            for condition in plan.conditions:
+                if not self.fits(condition):
+                    continue
+                bound = self.encode(self.constants(condition))
+                if bound is not None:
+                    filters.setdefault(condition.pred, {})[tuple(sorted(bound.items()))] = bound
+        memo = {}
+        for pred, group in filters.items():
+            selected = self.data[pred].select_many(list(group.values()), version)
+            for key, row_ids in zip(group, selected):
+                memo[pred, key] = row_ids
+                if METRICS.enabled:
+                    METRICS.count("rows_scanned", len(row_ids), pred)
+        return memo
+
+    def answer(self, plan, version, memo=None):
+        """Evaluate a valid plan at a data version and format its answer."""
+        strings = RouteStrings(self.strings)
+        bindings = self.execute(plan, version, memo, strings)
+        if plan.command == "VERIFY":
+            return "Yes" if bindings else "No"
+        if plan.command == "COUNT":
+            return len({tuple(binding[var] for var in plan.output) for binding in bindings})
+        if len(plan.output) == 1:
+            var = plan.output[0]
+            results = sorted({strings[binding[var]] for binding in bindings})
+        else:
+            results = sorted({tuple(strings[binding[var]] for var in plan.output) for binding in bindings})
+
+        return results if results else "No results found"
+
+    def stream(self, procedure, limit=None, offset=0, ordered=False):
+        """Iterator over the rows of a PRINT-ALL answer, found lazily, skipping offset rows and stopping after limit.
+
+        Rows are yielded as they are found, in no particular order; with ordered=True they come in
+        the same order as query() returns them. VERIFY, COUNT and invalid queries yield their one
+        message, and an empty answer yields nothing. A negative limit or offset raises ValueError
+        here, before any row is produced.
+        """
+        if limit is not None and limit < 0 or offset < 0:
+            raise ValueError(f"limit and offset must not be negative, got limit={limit} offset={offset}")
+        return self.stream_rows(procedure, limit, offset, ordered)
+
+    def stream_rows(self, procedure, limit, offset, ordered):
+        plan = self.compile(procedure)
+        error = self.check(plan)
+        if error or plan.command != "PRINT-ALL":
+            yield error if error else self.query(plan)
+            return
+        if ordered and limit is None or any(condition.pred in EXTREMES or condition.pred == ROUTE for condition in plan.conditions):
+            # The whole answer is wanted in order anyway (one sort or cache hit beats walking every value),
+            # or MIN/MAX and routes need every row before the first one is known
+            answer = self.query(plan)
+            rows = iter(answer if isinstance(answer, list) else ())
+        else:
+            version = self.version
+            cached = self.answers.get(plan, self.stamp(plan))
+            if cached is not None:
+                rows = iter(cached if isinstance(cached, list) else ())
+            elif ordered:
+                rows = self.ordered_rows(plan, version)
+            else:
+                rows = self.rows(plan, version)
+        yield from islice(rows, offset, None if limit is None else offset + limit)
+
+    def pipeline(self, conditions, version, start=None, strings=None):
+        """Yield bindings one at a time, probing each condition with the variables bound so far."""
+        start = start or {}
+        strings = strings if strings is not None else RouteStrings(self.strings)
+        facts, routes, windows, _ = self.constraints(conditions)
+        order = [condition for condition, _ in self.order(facts, start)] + routes
+        domains = {}
+
+        def walk(i, binding):
+            if i == len(order):
+                if not windows or self.within(binding, windows, strings):
+                    yield binding
+                return
+            condition = order[i]
+            if condition.pred == ROUTE:
+                for match in self.routes.matches(condition, binding, version, strings):
+                    yield from walk(i + 1, {**binding, **match})
+                return
+            shared = [var for var in condition.slots if var in binding]
+            if len(condition.slots) == 1 and shared:
+                if i not in domains:
+                    domains[i] = self.domain(condition, version)
+                if binding[shared[0]] in domains[i]:
+                    yield from walk(i + 1, binding)
+                return
+            extra = {condition.slots[var][0]: binding[var] for var in shared}
+            for match in self.matches(condition, extra, version, window=self.window(condition, windows)):
+                yield from walk(i + 1, {**binding, **match})
+
+        return walk(0, start)
+
+    def decode(self, plan, row, strings=None):
+        strings = strings if strings is not None else self.strings
+        if len(plan.output) == 1:
+            return strings[row[0]]
+        return tuple(strings[code] for code in row)
+
+    def rows(self, plan, version, start=None):
+        """Distinct decoded output rows of a plan, as soon as each is found."""
+        strings = RouteStrings(self.strings)
+        seen = set()
+        for binding in self.pipeline(plan.conditions, version, start, strings):
+            row = tuple(binding[var] for var in plan.output)
+            if row not in seen:
+                seen.add(row)
+                yield self.decode(plan, row, strings)
+
+    def ordered_rows(self, plan, version):
+        """Output rows in sorted order, walking the first output variable's values through a presorted index."""
+        var = plan.output[0]
+        candidates = [condition for condition in plan.conditions if var in condition.slots and self.fits(condition)]
+        if not candidates:
+            return
+        condition = min(candidates, key=self.estimate)
+        table = self.data[condition.pred]
+        keys = table.sorted_keys(self.COLUMNS[condition.pred][condition.slots[var][0]])
+        if self.estimate(condition) < len(keys):
+            # Fewer matching facts than values to walk: sorting the whole answer is cheaper
+            yield from sorted(self.rows(plan, version))
+            return
+        for code in keys:
+            yield from sorted(self.rows(plan, version, {var: code}))
+
+def hash_join(left, right, shared):
+    """Join two lists of bindings on their shared variables."""
+    if not shared:
+        return [{**l, **r} for l in left for r in right]
+    build, probe = (left, right) if len(left) <= len(right) else (right, left)
+    table = {}
+    for binding in build:
+        table.setdefault(tuple(binding[var] for var in shared), []).append(binding)
+    joined = []
+    for binding in probe:
+        for other in table.get(tuple(binding[var] for var in shared), ()):
+            joined.append({**other, **binding})
+    return joined
@@ -0,0 +1,21 @@
+import re
+
+# Arguments of each fact predicate in database.txt
+FACT_ARITY = {"MÁY_BAY": 1, "ATIME": 3, "DTIME": 3, "RUN-TIME": 4}
+
+def parse_fact(line):
+    """Parse one database line into (pred, row), or None when it is not a whole fact,
+    e.g. a line that is still being written."""
+    parts = line.split()
+    if not parts or not parts[-1].endswith(")"):
+        return None
+    for pred, arity in FACT_ARITY.items():
+        if parts[0].startswith("(" + pred) and len(parts) > arity:
+            args = [part.strip(")") for part in parts[1:arity + 1]]
+            return pred, args[0] if pred == "MÁY_BAY" else tuple(args)
+    return None
+
+def airline(plane):
+    """Airline code of a plane, e.g. VJ for VJ1."""
+    match = re.match(r"[^\d]+", plane)
+    return match.group(0) if match else plane
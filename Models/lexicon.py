@@ -0,0 +1,224 @@
+from collections import deque
+from dataclasses import dataclass
+from Models.facts import airline, parse_fact
+
+LEXICON_FILE = "input/lexicon.txt"
+DATABASE_FILE = "input/database.txt"
+
+@dataclass(frozen=True, slots=True)
+class Entity:
+    """A city, airline or plane: its database code and the name the parser works with."""
+    kind: str
+    code: str
+    name: str
+
+def fold(text):
+    """Collapse whitespace runs to single spaces, the form surface strings are matched in."""
+    return " ".join(text.split())
+
+def is_word(char):
+    return char.isalnum() or char == "_"
+
+def prefix_start(text, end, floor, prefix):
+    """Start of prefix written right before end and not before floor (a whitespace run matches
+    each of its spaces), or None."""
+    k = end
+    for char in reversed(prefix):
+        if char == " ":
+            if k <= floor or not text[k - 1].isspace():
+                return None
+            while k > floor and text[k - 1].isspace():
+                k -= 1
+        elif k > floor and text[k - 1] == char:
+            k -= 1
+        else:
+            return None
+    return k
+
+class Gazetteer:
+    """Aho-Corasick automaton over surface strings, finding every whole-word mention in one pass.
+
+    Whitespace runs in the text match a single space in a surface string; matching is case-sensitive.
+    """
+
+    def __init__(self, surfaces):
+        # Trie nodes: goto edges, failure link, longest surface ending here and the nearest
+        # node on the failure chain that ends a surface
+        self.goto = [{}]
+        self.fail = [0]
+        self.found = [None]
+        self.output = [0]
+        for surface, value in surfaces.items():
+            node = 0
+            for char in surface:
+                nxt = self.goto[node].get(char)
+                if nxt is None:
+                    nxt = self.goto[node][char] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.found.append(None)
+                    self.output.append(0)
+                node = nxt
+            self.found[node] = (len(surface), value)
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, nxt in self.goto[node].items():
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[nxt] = self.goto[fail].get(char, 0)
+                self.output[nxt] = self.fail[nxt] if self.found[self.fail[nxt]] else self.output[self.fail[nxt]]
+                queue.append(nxt)
+
+    def find(self, text):
+        """Leftmost-longest whole-word mentions as (start, end, value) spans of text."""
+        # Feed the text with whitespace runs folded, remembering where each fed char came from
+        fed = []
+        for i, char in enumerate(text):
+            if char.isspace():
+                if fed and fed[-1][1] == " ":
+                    continue
+                char = " "
+            fed.append((i, char))
+        candidates = []
+        node = 0
+        for k, (i, char) in enumerate(fed):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            hit = node if self.found[node] else self.output[node]
+            while hit:
+                length, value = self.found[hit]
+                start, end = fed[k - length + 1][0], i + 1
+                if not (start > 0 and is_word(text[start - 1]) and is_word(text[start])) and \
+                        not (end < len(text) and is_word(text[end]) and is_word(text[end - 1])):
+                    candidates.append((start, -end, value))
+                hit = self.output[hit]
+        spans = []
+        for start, end, value in sorted(candidates, key=lambda c: c[:2]):
+            if not spans or start >= spans[-1][1]:
+                spans.append((start, -end, value))
+        return spans
+
+class Lexicon:
+    """Every city, airline and plane the pipeline knows, by name, alias and database code.
+
+    Entities come from the database facts (plane codes, their airlines and every city code) and
+    from an alias file giving each code the name the parser uses and its other spellings.
+    """
+
+    def __init__(self, entities, aliases=(), prefixes=None):
+        self.entities = list(entities)
+        # Kind -> words that may precede a mention of that kind, any number of times, e.g. TP. for cities
+        self.prefixes = {kind: [fold(prefix) for prefix in words] for kind, words in (prefixes or {}).items()}
+        surfaces = {}
+        for entity in self.entities:
+            surfaces.setdefault(entity.code, entity)
+            surfaces[entity.name] = entity
+        for alias, entity in aliases:
+            surfaces[fold(alias)] = entity
+        self.surfaces = surfaces
+        # Case-insensitive lookup of a single mention, e.g. an upper-cased logical form argument
+        self.keys = {surface.casefold(): entity for surface, entity in surfaces.items()}
+        self.gazetteer = Gazetteer(surfaces)
+
+    @classmethod
+    def load(cls, path=LEXICON_FILE, database=DATABASE_FILE):
+        """Entities of a database file, named and aliased by a lexicon file; either may be missing."""
+        entities = {}
+        aliases = []
+        prefixes = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.split("#", 1)[0].strip()
+                    if not line:
+                        continue
+                    kind, code, name, *others = [part.strip() for part in line.split("|")]
+                    if kind == "prefix":
+                        # prefix | kind | words...: words that may precede any mention of that kind
+                        prefixes.setdefault(code, []).extend(word for word in (name, *others) if word)
+                        continue
+                    entity = entities[kind, code] = Entity(kind, code, name)
+                    aliases.extend((alias, entity) for alias in others if alias)
+        except FileNotFoundError:
+            print(f"Warning: Lexicon file {path} not found. Using database codes only.")
+        for kind, code in cls.codes(database):
+            if (kind, code) not in entities:
+                entities[kind, code] = Entity(kind, code, code)
+        return cls(entities.values(), aliases, prefixes)
+
+    @staticmethod
+    def codes(database):
+        """(kind, code) of every plane, airline and city in a database file."""
+        seen = set()
+        try:
+            with open(database, "r", encoding="utf-8") as f:
+                for line in f:
+                    fact = parse_fact(line)
+                    if fact is None:
+                        continue
+                    pred, row = fact
+                    if pred == "MÁY_BAY":
+                        found = (("plane", row), ("airline", airline(row)))
+                    elif pred == "RUN-TIME":
+                        found = (("plane", row[0]), ("city", row[1]), ("city", row[2]))
+                    else:
+                        found = (("plane", row[0]), ("city", row[1]))
+                    seen.update(found)
+        except FileNotFoundError:
+            pass
+        return sorted(seen)
+
+    def names(self, kind):
+        """Names the parser uses for every entity of a kind."""
+        return [entity.name for entity in self.entities if entity.kind == kind]
+
+    def lookup(self, text, kind=None):
+        """Entity mentioned by exactly text (any case and spacing), or None."""
+        entity = self.keys.get(fold(text).casefold())
+        return entity if entity is not None and (kind is None or entity.kind == kind) else None
+
+    def code(self, text, kind=None, default=None):
+        entity = self.lookup(text, kind)
+        return entity.code if entity is not None else default
+
+    def mentions(self, text, kind=None):
+        """Entities (of a kind) mentioned in text, in order."""
+        return [entity for _, _, entity in self.gazetteer.find(text) if kind is None or entity.kind == kind]
+
+    def normalize(self, text):
+        """Replace every mention in text by its entity's name, in one pass.
+
+        A mention takes along the prefixes of its kind written right before it, so TP. TP.HCM is
+        one mention of Hồ Chí Minh.
+        """
+        parts = []
+        last = 0
+        for start, end, entity in self.gazetteer.find(text):
+            start = self.extend(text, start, last, entity.kind)
+            parts.append(text[last:start])
+            parts.append(entity.name)
+            last = end
+        parts.append(text[last:])
+        return "".join(parts)
+
+    def extend(self, text, start, floor, kind):
+        """Start of a mention once the prefixes of its kind before it, but not before floor, are included."""
+        prefixes = self.prefixes.get(kind, ())
+        while True:
+            end = start
+            while end > floor and text[end - 1].isspace():
+                end -= 1
+            for prefix in prefixes:
+                begin = prefix_start(text, end, floor, prefix)
+                if begin is not None and (begin == 0 or not is_word(text[begin - 1])):
+                    start = begin
+                    break
+            else:
+                return start
+
+    def fingerprint(self):
+        return (sorted((surface, entity.kind, entity.code, entity.name) for surface, entity in self.surfaces.items()),
+                sorted(self.prefixes.items()))
@@ -0,0 +1,48 @@
+from dataclasses import dataclass
+
+@dataclass(frozen=True, slots=True)
+class Argument:
+    """One argument of a logical predicate, e.g. [TO-LOC HUẾ]; the subject has no role and renders as [MÁY BAY]."""
+    role: str
+    value: str
+
+    def __str__(self):
+        return f"[{self.role} {self.value}]" if self.role else f"[{self.value}]"
+
+@dataclass(frozen=True, slots=True)
+class Which:
+    """The questioned entity, e.g. (m1 WHICH MÁY BAY)."""
+    target: str
+    var: str = "m1"
+
+    def __str__(self):
+        return f"({self.var} WHICH {self.target})"
+
+@dataclass(frozen=True, slots=True)
+class Predicate:
+    """The main predicate with its arguments in parse order, e.g. (m1 PRED ĐẾN [MÁY BAY] [TO-LOC HUẾ])."""
+    name: str
+    args: tuple = ()
+    var: str = "m1"
+
+    def first(self, *roles):
+        """Value of the first argument with one of roles, or None."""
+        for arg in self.args:
+            if arg.role in roles:
+                return arg.value
+        return None
+
+    def __str__(self):
+        return f"({self.var} PRED {self.name} {' '.join(map(str, self.args))})"
+
+def format_logical(forms):
+    """Render logical forms as the strings written to logical.txt."""
+    return [str(form) for form in forms]
+
+def logical_to_json(forms):
+    return [[form.var, "WHICH", form.target] if isinstance(form, Which)
+            else [form.var, "PRED", form.name, [[arg.role, arg.value] for arg in form.args]] for form in forms]
+
+def logical_from_json(data):
+    return [Which(item[2], item[0]) if item[1] == "WHICH"
+            else Predicate(item[2], tuple(Argument(role, value) for role, value in item[3]), item[0]) for item in data]
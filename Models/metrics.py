@@ -0,0 +1,199 @@
+import cProfile
+import json
+import math
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, growing by 2^(1/4) from 1µs to about 70s
+BUCKETS = tuple(1e-6 * 2 ** (k / 4) for k in range(105))
+
+class Histogram:
+    """Latency histogram over fixed log-spaced buckets; quantiles are read from the bucket bounds."""
+    __slots__ = ("counts", "count", "sum", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, seconds):
+        k = 0 if seconds <= BUCKETS[0] else min(int(4 * math.log2(seconds / BUCKETS[0])) + 1, len(BUCKETS))
+        self.counts[k] += 1
+        self.count += 1
+        self.sum += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation (within a factor 2^(1/4))."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for k, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(BUCKETS[k] if k < len(BUCKETS) else self.max, self.max)
+        return self.max
+
+    def summary(self):
+        return {"count": self.count, "sum": self.sum, "mean": self.sum / self.count if self.count else 0.0,
+                "min": self.min if self.count else 0.0, "max": self.max,
+                "p50": self.quantile(0.5), "p95": self.quantile(0.95), "p99": self.quantile(0.99)}
+
+class NullTimer:
+    """Timer handed out while metrics are disabled: entering and leaving it does nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_TIMER = NullTimer()
+
+class Timer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, self.start)
+        return False
+
+class Metrics:
+    """Stage timers, event counters and an optional cProfile hook for the pipeline and database.
+
+    Disabled by default: timer() then returns a shared no-op and callers guard counters with
+    `if METRICS.enabled`, so instrumentation left in place costs an attribute check per call.
+    Updates come from the server's executor threads and the watcher, so they and the exports
+    hold `lock`.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.profiler = None
+        # Optional callable(name, start, seconds) receiving every timed span, e.g. for tracing
+        self.tracer = None
+
+    def enable(self, profile=False, tracer=None):
+        self.enabled = True
+        self.tracer = tracer
+        if profile and self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return self
+
+    def disable(self):
+        self.enabled = False
+        if self.profiler is not None:
+            self.profiler.disable()
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def timer(self, name):
+        """Context manager timing one stage into the histogram `name`."""
+        return Timer(self, name) if self.enabled else NULL_TIMER
+
+    def observe(self, name, seconds, start=None):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+        if self.tracer is not None:
+            self.tracer(name, start, seconds)
+
+    def count(self, name, n=1, label=None):
+        key = (name, label)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def to_json(self):
+        with self.lock:
+            items = sorted(self.counters.items(), key=lambda item: (item[0][0], str(item[0][1])))
+            stages = {name: h.summary() for name, h in self.histograms.items()}
+        counters = {}
+        for (name, label), n in items:
+            if label is None:
+                counters[name] = n
+            else:
+                counters.setdefault(name, {})[label] = n
+        return {"stages": stages, "counters": counters}
+
+    def to_prometheus(self, prefix="nlp"):
+        """Prometheus text exposition: one histogram labelled by stage plus one counter per event name."""
+        with self.lock:
+            lines = [f"# TYPE {prefix}_stage_seconds histogram"]
+            for name, h in self.histograms.items():
+                seen = 0
+                # Only emit bounds up to the largest observation to keep the output short
+                for k, bound in enumerate(BUCKETS):
+                    seen += h.counts[k]
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound:.6g}"}} {seen}')
+                    if seen == h.count:
+                        break
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {h.count}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {h.sum:.9f}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {h.count}')
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                for (counter, label), n in self.counters.items():
+                    if counter == name:
+                        labels = f'{{kind="{label}"}}' if label is not None else ""
+                        lines.append(f"{prefix}_{name}_total{labels} {n}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """Write metrics to path: Prometheus text for .prom/.txt, JSON otherwise."""
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith((".prom", ".txt")):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.to_json(), f, ensure_ascii=False, indent=2)
+
+    def dump_profile(self, path=None, sort="cumulative", limit=30):
+        """Stop the profiler started by enable(profile=True) and save its stats to path, or print the top entries."""
+        if self.profiler is None:
+            return
+        self.profiler.disable()
+        if path:
+            self.profiler.dump_stats(path)
+        else:
+            pstats.Stats(self.profiler).sort_stats(sort).print_stats(limit)
+        self.profiler = None
+
+    @contextmanager
+    def profile(self, path=None, sort="cumulative"):
+        """Profile only the enclosed block with cProfile, independently of enable()."""
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            if path:
+                profiler.dump_stats(path)
+            else:
+                pstats.Stats(profiler).sort_stats(sort).print_stats(30)
+
+# Process-wide instance shared by the parser, processor, database and server
+METRICS = Metrics()
@@ -0,0 +1,24 @@
+import re
+
+class Normalizer:
+    """Apply a table of (pattern, replacement) rewrites in a single left-to-right pass."""
+
+    def __init__(self, rules):
+        alternatives = []
+        self.templates = {}
+        group = 1
+        for pattern, replacement in rules:
+            alternatives.append(f"({pattern})")
+            # Replacement \N refers to the rule's own groups, which sit right after its wrapper group
+            self.templates[group] = [int(part) + group if i % 2 else part
+                                     for i, part in enumerate(re.split(r"\\(\d)", replacement))]
+            group += re.compile(pattern).groups + 1
+        self.pattern = re.compile("|".join(alternatives))
+
+    def _replace(self, match):
+        # The wrapper group closes last, so lastindex identifies the rule that matched
+        return "".join(part if isinstance(part, str) else (match.group(part) or "")
+                       for part in self.templates[match.lastindex])
+
+    def __call__(self, text):
+        return self.pattern.sub(self._replace, text)
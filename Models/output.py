@@ -0,0 +1,242 @@
+import json
+import os
+import queue
+import struct
+import threading
+import time
+from Models.logical import format_logical
+from Models.parser import format_arcs
+from Models.plan import format_procedure
+
+FORMATS = ("text", "jsonl", "binary")
+# File written by each single-stream format
+STREAM_FILES = {"jsonl": "results.jsonl", "binary": "results.bin"}
+
+# Fields of a stream record, the same JSON object the HTTP server answers with
+RECORD_FIELDS = ("question", "tokens", "dependencies", "grammatical", "logical", "procedural", "answer")
+
+MAGIC = b"FLOT"
+VERSION = 2
+# Magic, format version and length of the JSON field list that starts a binary stream
+PREFIX = struct.Struct("<4sII")
+# Byte length of each JSON-encoded field of a binary record
+LENGTH = struct.Struct("<I")
+
+def result_record(question, result, answer):
+    """JSON-ready record of one question: its pipeline stages and answer as lists and strings."""
+    return {"question": question, **result, "dependencies": format_arcs(result["dependencies"]),
+            "logical": format_logical(result["logical"]), "procedural": format_procedure(result["procedural"]),
+            "answer": answer}
+
+class OutputWriter:
+    """Keep the pipeline output files open and write buffered lines to them."""
+
+    # Records are {filename: line} rather than result_record dicts
+    structured = False
+
+    def __init__(self, directory, filenames, buffer_size=1 << 16, append=False):
+        os.makedirs(directory, exist_ok=True)
+        mode = "a" if append else "w"
+        self.files = {
+            name: open(os.path.join(directory, name), mode, encoding="utf-8", buffering=buffer_size)
+            for name in filenames
+        }
+
+    def write(self, filename, line):
+        """Queue one line for an output file."""
+        self.files[filename].write(line + "\n")
+
+    def write_record(self, record):
+        """Queue the lines of one question, given as {filename: line}; returns the characters queued."""
+        size = 0
+        for filename, line in record.items():
+            self.files[filename].write(line + "\n")
+            size += len(line) + 1
+        return size
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class StreamWriter:
+    """Write each question as one record of a single file instead of one line per stage file.
+
+    Records are result_record dicts with the given fields. In jsonl format a record is a JSON
+    object on one line; a binary stream starts with PREFIX and the JSON list of field names, then
+    holds each record as one length-prefixed UTF-8 JSON value per field.
+    """
+
+    structured = True
+
+    def __init__(self, directory, fields=RECORD_FIELDS, format="jsonl", buffer_size=1 << 16, append=False):
+        os.makedirs(directory, exist_ok=True)
+        self.fields = list(fields)
+        self.format = format
+        self.path = os.path.join(directory, STREAM_FILES[format])
+        if format == "jsonl":
+            self.file = open(self.path, "a" if append else "w", encoding="utf-8", buffering=buffer_size)
+            return
+        if append and os.path.exists(self.path) and os.path.getsize(self.path):
+            with open(self.path, "rb") as f:
+                if read_header(f) != self.fields:
+                    raise ValueError(f"{self.path} holds other fields than {self.fields}")
+            self.file = open(self.path, "ab", buffering=buffer_size)
+            return
+        self.file = open(self.path, "wb", buffering=buffer_size)
+        header = json.dumps(self.fields).encode("utf-8")
+        self.file.write(PREFIX.pack(MAGIC, VERSION, len(header)) + header)
+
+    def write_record(self, record):
+        """Queue one question's record; returns the characters (or bytes) queued."""
+        if self.format == "jsonl":
+            line = json.dumps({field: record.get(field) for field in self.fields}, ensure_ascii=False) + "\n"
+            self.file.write(line)
+            return len(line)
+        frame = []
+        for field in self.fields:
+            data = json.dumps(record.get(field), ensure_ascii=False).encode("utf-8")
+            frame += [LENGTH.pack(len(data)), data]
+        data = b"".join(frame)
+        self.file.write(data)
+        return len(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_header(f):
+    """Field names of a binary stream, reading f past its header."""
+    magic, version, size = PREFIX.unpack(f.read(PREFIX.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{f.name} is not a version {VERSION} output stream")
+    return json.loads(f.read(size))
+
+def read_stream(path):
+    """Records of a jsonl or binary output stream as {field: value} dicts."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            f.seek(0)
+            for line in f:
+                yield json.loads(line)
+            return
+        f.seek(0)
+        fields = read_header(f)
+        while head := f.read(LENGTH.size):
+            record = {}
+            for i, field in enumerate(fields):
+                if i:
+                    head = f.read(LENGTH.size)
+                record[field] = json.loads(f.read(LENGTH.unpack(head)[0]))
+            yield record
+
+class BackgroundWriter:
+    """Run an OutputWriter or StreamWriter on its own thread so that disk writes never block the caller.
+
+    Writes are queued and applied in order by the thread, which flushes the writer once
+    flush_size characters are pending or flush_interval seconds after the oldest pending write,
+    whichever comes first, and on flush() and close(). The queue is bounded, so a caller that
+    outruns the disk waits instead of buffering without limit. An error on the thread is raised
+    by the next call.
+    """
+
+    def __init__(self, writer, flush_size=1 << 16, flush_interval=1.0, queue_size=4096):
+        self.writer = writer
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(queue_size)
+        self.error = None
+        self.structured = writer.structured
+        self.thread = threading.Thread(target=self.run, name="output-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, filename, line):
+        self.put("line", (filename, line))
+
+    def write_record(self, record):
+        self.put("record", record)
+
+    def flush(self):
+        """Wait until everything written so far is flushed to the files."""
+        done = threading.Event()
+        self.put("flush", done)
+        done.wait()
+        self.check()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(("close", None))
+            self.thread.join()
+        self.writer.close()
+        self.check()
+
+    def put(self, kind, payload):
+        self.check()
+        self.queue.put((kind, payload))
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        pending = 0
+        deadline = None
+        while True:
+            try:
+                kind, payload = self.queue.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                kind, payload = "flush", None
+            if kind == "close":
+                return
+            # After an error the queue is still drained so that callers never block on it
+            if self.error is None:
+                try:
+                    if kind == "record":
+                        pending += self.writer.write_record(payload)
+                    elif kind == "line":
+                        self.writer.write(*payload)
+                        pending += len(payload[1])
+                    if pending and deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+                    if kind == "flush" or pending >= self.flush_size or (deadline is not None and time.monotonic() >= deadline):
+                        self.writer.flush()
+                        pending = 0
+                        deadline = None
+                except Exception as error:
+                    self.error = error
+                    deadline = None
+            if kind == "flush" and payload is not None:
+                payload.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def open_writer(directory, filenames, format="text", background=True, buffer_size=1 << 16, flush_interval=1.0, append=False):
+    """Writer for the output files: one file per filename ("text") or a single jsonl or binary stream
+    of result_record dicts, run on a background thread unless background is False. Callers check
+    its structured flag to know which kind of record to write."""
+    if format == "text":
+        writer = OutputWriter(directory, filenames, buffer_size, append)
+    else:
+        writer = StreamWriter(directory, RECORD_FIELDS, format, buffer_size, append)
+    return BackgroundWriter(writer, buffer_size, flush_interval) if background else writer
@@ -1,20 +1,44 @@
-from underthesea import word_tokenize
+from Models.lexicon import DATABASE_FILE, LEXICON_FILE, Lexicon
+from Models.metrics import METRICS
+from Models.normalizer import Normalizer
+import hashlib
 import re
 
+# Rewrites applied before word segmentation, after entity names, in one pass; at a given position
+# the first matching rule wins
+NORMALIZATION_RULES = [
+    (r"\bVNAirline bay\b", "VNAirline *bay"),
+    # Keep underthesea from merging these words into one token
+    (r"\b(VJ5)\s+bay\b", r"\1* bay"),
+    (r"\b(Hải\sPhòng)\s+không\b", r"\1 * không"),
+    # Time patterns
+    (r"\bmấy\s+giờ\b", "mấy_giờ"),
+    (r"(\d{1,2})\s*giờ", r"\1:00HR"),
+    (r"(\d{1,2})\s*:\s*(\d{2})\s*HR", r"\1:\2HR"),
+]
+# underthesea is slow to import and load, so it is pulled in on first tokenize
+_word_tokenize = None
+
+def format_arcs(arcs):
+    """Render (label, head, dep) arcs as label(head, dep) strings, as written to dependencies.txt."""
+    return [f"{label}({head}, {dep})" for label, head, dep in arcs]
+
+def load_word_tokenize():
+    """Import underthesea's word_tokenize on first use."""
+    global _word_tokenize
+    if _word_tokenize is None:
+        from underthesea import word_tokenize
+        _word_tokenize = word_tokenize
+    return _word_tokenize
+
+TIME_TOKEN = re.compile(r"\d{1,2}:\d{2}HR")
+MINUTES_HR = re.compile(r"\d{2}HR")
+
 class DependencyParser:
-    def __init__(self):
-        # City names for dependency parsing
-        self.cities = ["Huế", "Hồ Chí Minh", "Đà Nẵng", "Hà Nội", "Khánh Hòa", "Hải Phòng"]
-        # City mapping
-        self.city_mappings = {
-            "Huế": "HUE",
-            "Hồ Chí Minh": "HCMC",
-            "Đà Nẵng": "ĐN",
-            "Hà Nội": "HN",
-            "Hà Nội": "HN",
-            "Khánh Hòa": "KH",
-            "Hải Phòng": "HP"
-        }
+    def __init__(self, database=DATABASE_FILE, lexicon=LEXICON_FILE):
+        # Cities, airlines and planes with their aliases, from the database and the lexicon file
+        self.lexicon = Lexicon.load(lexicon, database)
+        self.rewrite = Normalizer(NORMALIZATION_RULES)
         # Load stopwords from file
         self.stopwords = self.load_stopwords("input/vietnamese-stopwords.txt")
         # Golden-tree bank: Unified list of (head, dependent, label) relations
@@ -123,6 +147,42 @@ class DependencyParser:
             ("bay", "!", "punctuation"),
 
         ]
+        self.compile_bank()
+
+    def compile_bank(self):
+        """Index the golden-tree bank by (head, dep), head and dep so each transition is a dict lookup."""
+        self.bank_labels = {}
+        self.bank_count = {}
+        self.bank_by_head = {}
+        self.bank_by_dep = {}
+        self.bank_head_count = {}
+        for head, dep, label in self.golden_tree_bank:
+            arc = (label, head, dep)
+            if arc not in self.bank_count:
+                self.bank_labels.setdefault((head, dep), []).append(label)
+                self.bank_by_head.setdefault(head, set()).add(arc)
+                self.bank_by_dep.setdefault(dep, set()).add(arc)
+            # Duplicate relations still count towards the reduce condition, as in the list scan
+            self.bank_count[arc] = self.bank_count.get(arc, 0) + 1
+            self.bank_head_count[head] = self.bank_head_count.get(head, 0) + 1
+
+    def in_bank(self, token):
+        """Whether the golden-tree bank has an arc on token, so that the parse depends on it."""
+        return token in self.bank_head_count or token in self.bank_by_dep
+
+    def warm_up(self):
+        """Import underthesea and load its model now, e.g. before a service takes traffic."""
+        load_word_tokenize()("Máy bay nào đến Huế ?")
+
+    def normalize(self, sentence):
+        """Rename every entity mention to its lexicon name, then apply NORMALIZATION_RULES."""
+        return self.rewrite(self.lexicon.normalize(sentence))
+
+    def fingerprint(self):
+        """Hash of everything that shapes the parse: stopwords, golden bank, normalization rules and lexicon."""
+        config = repr((sorted(self.stopwords), self.golden_tree_bank, NORMALIZATION_RULES,
+                       self.lexicon.fingerprint()))
+        return hashlib.sha256(config.encode("utf-8")).hexdigest()
 
     def load_stopwords(self, filepath):
         """Load stopwords from a file."""
@@ -139,31 +199,11 @@ class DependencyParser:
 
     def tokenize(self, sentence):
         """Tokenize using underthesea, merge city and time tokens."""
-        # Preprocess to prevent VJ5 bay merging
-        sentence = re.sub(r'\b(VJ5)\s+bay\b', r'\1* bay', sentence)
-        sentence = re.sub(r'\bHCMC\b', r'Hồ Chí Minh', sentence)
-        sentence = re.sub(r'\bTP.HCM\b', r'Hồ Chí Minh', sentence)
-        sentence = re.sub(r'\b(Hải\sPhòng)\s+không\b', r'\1 * không', sentence)
-        # Preprocess to merge 'hãng hàng không VietJet Air' into 'VietJet Air'
-        sentence = re.sub(r'hãng\s+hàng\s+không\s+VietJet\s+Air', 'VietJet Air', sentence)
-        sentence = re.sub(r'\bVNAirline bay\b', 'VNAirline *bay', sentence)
-        # Preprocess specific patterns
-        sentence = re.sub(r'\bmấy\s+giờ\b', 'mấy_giờ', sentence)
-        sentence = re.sub(r'TP\.\s*Hồ Chí Minh', 'Hồ Chí Minh', sentence)
-        sentence = re.sub(r'Tp\.\s*Hồ Chí Minh', 'Hồ Chí Minh', sentence)
-        sentence = re.sub(r'TP\.\s*HCMC', 'Hồ Chí Minh', sentence)
-        sentence = re.sub(r'Tp\.\s*HCMC', 'Hồ Chí Minh', sentence)
-        sentence = re.sub(r'TP\.\s*Hà Nội', 'Hà Nội', sentence)
-        sentence = re.sub(r'Tp\.\s*Hà Nội', 'Hà Nội', sentence)
-        sentence = re.sub(r'(\d{1,2})\s*giờ', r'\1:00HR', sentence)
-        sentence = re.sub(r'(\d{1,2})\s*:\s*(\d{2})\s*HR', r'\1:\2HR', sentence)
-        sentence = re.sub(r'(\d{1,2})\s*:\s*(\d{2}HR)', r'\1:\2', sentence)
+        sentence = self.normalize(sentence)
         # Use underthesea word_tokenize
-        tokens = word_tokenize(sentence)
-        tokens = [t.replace("_", " ") for t in tokens]
-        unique_tokens = []
-        [unique_tokens.append(x) for x in tokens if x not in unique_tokens]
-        tokens = unique_tokens
+        tokens = load_word_tokenize()(sentence)
+        # Drop repeated tokens, keeping the first occurrence
+        tokens = list(dict.fromkeys(t.replace("_", " ") for t in tokens))
         
         merged_tokens = []
         i = 0
@@ -171,10 +211,10 @@ class DependencyParser:
             if i + 3 < len(tokens) and tokens[i].isdigit() and tokens[i + 1] == ":" and tokens[i + 2].isdigit() and tokens[i + 3] == "HR":
                 merged_tokens.append(f"{tokens[i]}:{tokens[i + 2]}HR")
                 i += 4
-            elif i + 2 < len(tokens) and tokens[i].isdigit() and tokens[i + 1] == ":" and re.match(r"\d{2}HR", tokens[i + 2]):
+            elif i + 2 < len(tokens) and tokens[i].isdigit() and tokens[i + 1] == ":" and MINUTES_HR.match(tokens[i + 2]):
                 merged_tokens.append(f"{tokens[i]}:{tokens[i + 2]}")
                 i += 3
-            elif re.match(r"\d{1,2}:\d{2}HR", tokens[i]):
+            elif TIME_TOKEN.match(tokens[i]):
                 merged_tokens.append(tokens[i])
                 i += 1
             else:
@@ -183,65 +223,87 @@ class DependencyParser:
         # return merged_tokens
         return [token for token in merged_tokens if token.lower() not in self.stopwords] 
 
-    def get_dependencies(self, sentence):
-        """Arc-eager dependency parser using golden-tree bank."""
-        tokens = self.tokenize(sentence)
+    def parse(self, sentence):
+        """Tokenize a sentence once and return its tokens together with its dependency arcs."""
+        with METRICS.timer("tokenize"):
+            tokens = self.tokenize(sentence)
+        with METRICS.timer("get_dependencies"):
+            return tokens, self.get_dependencies(sentence, tokens)
+
+    def get_dependencies(self, sentence, tokens=None):
+        """Arc-eager dependency parser using golden-tree bank, returning (label, head, dep) arcs; pass tokens to skip re-tokenizing."""
+        if tokens is None:
+            tokens = self.tokenize(sentence)
         stack = ["root"]
-        buffer = tokens[:]
+        buffer = tokens
+        b = 0
         arcs = []
-        
+
+        # Parser state kept incrementally; arcs are (label, head, dep) tuples until output
         assigned_deps = set()
+        assigned_per_dep = {}
+        arc_set = set()
+        arcs_per_head = {}
+        assigned_total = 0
+        rooted = set()
+        transitions = {} if METRICS.enabled else None
 
-        def can_reduce(stack, arcs):
-            if len(stack) < 1:
-                return False
-            s_top = stack[-1]
-            if f"root(root, {s_top})" in arcs:
+        def add_arc(arc, transition):
+            nonlocal assigned_total
+            arcs.append(arc)
+            label, head, dep = arc
+            if transition:
+                assigned_deps.add(arc)
+                assigned_per_dep[dep] = assigned_per_dep.get(dep, 0) + 1
+            if label == "root" and head == "root":
+                rooted.add(dep)
+            if arc not in arc_set:
+                arc_set.add(arc)
+                if arc in self.bank_count:
+                    assigned_total += self.bank_count[arc]
+                    arcs_per_head[head] = arcs_per_head.get(head, 0) + 1
+
+        def can_reduce(s_top):
+            if s_top in rooted:
                 return False
-            assigned_as_dep = any(f"{l}({h}, {s_top})" in arc for arc in arcs for h, d, l in self.golden_tree_bank if f"{l}({h}, {d})" == arc)
-            expected_deps = [f"{l}({h}, {d})" for h, d, l in self.golden_tree_bank if h == s_top]
-            assigned = [f"{l}({h}, {d})" for h, d, l in self.golden_tree_bank if f"{l}({h}, {d})" in arcs]
-            pending_deps = [f"{l}({h}, {d})" for h, d, l in self.golden_tree_bank if d == s_top and f"{l}({h}, {d})" not in assigned_deps]
-            return (assigned_as_dep and not expected_deps) or (len(expected_deps) == len(assigned) and not pending_deps) or (set(expected_deps) <= set(assigned)) or (set(expected_deps) & set(assigned))
+            expected = self.bank_head_count.get(s_top, 0)
+            if not expected or arcs_per_head.get(s_top, 0):
+                return True
+            pending = len(self.bank_by_dep.get(s_top, ())) > assigned_per_dep.get(s_top, 0)
+            return expected == assigned_total and not pending
 
-        def find_action(stack, buffer):
+        def find_action(stack, b_front):
             if len(stack) < 1:
                 return None, None
             s_top = stack[-1].lower()
-            b_front = buffer[0] if buffer else None
-            
-            valid_actions = []
-            if buffer:
-                for head, dep, label in self.golden_tree_bank:
-                    dep_str = f"{label}({head}, {dep})"
-                    if dep_str not in assigned_deps and head == b_front and dep == s_top:
-                        valid_actions.append(("LEFT-ARC", (label, head, dep)))
-            if buffer:
-                for head, dep, label in self.golden_tree_bank:
-                    dep_str = f"{label}({head}, {dep})"
-                    if dep_str not in assigned_deps and head == s_top and dep == b_front:
-                        valid_actions.append(("RIGHT-ARC", (label, head, dep)))
-            if can_reduce(stack, arcs):
-                valid_actions.append(("REDUCE", None))
-            if buffer:
-                valid_actions.append(("SHIFT", None))
-            return valid_actions[0] if valid_actions else (None, None)
+            if b_front is not None:
+                for label in self.bank_labels.get((b_front, s_top), ()):
+                    if (label, b_front, s_top) not in assigned_deps:
+                        return "LEFT-ARC", (label, b_front, s_top)
+                for label in self.bank_labels.get((s_top, b_front), ()):
+                    if (label, s_top, b_front) not in assigned_deps:
+                        return "RIGHT-ARC", (label, s_top, b_front)
+            if can_reduce(stack[-1]):
+                return "REDUCE", None
+            if b_front is not None:
+                return "SHIFT", None
+            return None, None
 
-        while buffer or len(stack) > 1:
-            action, arc_info = find_action(stack, buffer)
-            if action == "SHIFT" and buffer:
-                stack.append(buffer.pop(0))
-            elif action == "LEFT-ARC" and stack and buffer:
-                label, head, dep = arc_info
-                arcs.append(f"{label}({head}, {dep})")
-                assigned_deps.add(f"{label}({head}, {dep})")
+        while b < len(buffer) or len(stack) > 1:
+            action, arc = find_action(stack, buffer[b] if b < len(buffer) else None)
+            if transitions is not None:
+                transitions[action] = transitions.get(action, 0) + 1
+            if action == "SHIFT":
+                stack.append(buffer[b])
+                b += 1
+            elif action == "LEFT-ARC" and stack:
+                add_arc(arc, True)
                 stack.pop(-1)
-            elif action == "RIGHT-ARC" and stack and buffer:
-                label, head, dep = arc_info
-                arcs.append(f"{label}({head}, {dep})")
-                assigned_deps.add(f"{label}({head}, {dep})")
-                stack.append(buffer.pop(0))
-                if label in ["question", "punctuation"]:
+            elif action == "RIGHT-ARC" and stack:
+                add_arc(arc, True)
+                stack.append(buffer[b])
+                b += 1
+                if arc[0] in ["question", "punctuation"]:
                     break
             elif action == "REDUCE" and stack:
                 stack.pop(-1)
@@ -251,7 +313,10 @@ class DependencyParser:
                 else:
                     break
 
-            if stack and stack[-1] in ["đến", "bay", "xuất phát", "hạ cánh", "mất"] and "root(root, " not in "".join(arcs):
-                arcs.append(f"root(root, {stack[-1]})")
+            if stack and stack[-1] in ["đến", "bay", "xuất phát", "hạ cánh", "mất"] and not rooted:
+                add_arc(("root", "root", stack[-1]), False)
 
-        return arcs if arcs else []
\ No newline at end of file
+        if transitions is not None:
+            for action, n in transitions.items():
+                METRICS.count("parser_transitions", n, action or "STOP")
+        return arcs
@@ -0,0 +1,109 @@
+from dataclasses import dataclass, field
+
+# Conditions on a time variable bound by a fact, e.g. (< ?time 12:00HR) and (MIN ?time)
+COMPARISONS = ("<", "<=", ">", ">=")
+EXTREMES = ("MIN", "MAX")
+# Derived predicate answered by route search, (ROUTE source dest ?route ?time)
+ROUTE = "ROUTE"
+
+@dataclass(frozen=True, slots=True, repr=False)
+class Condition:
+    """One procedural condition such as (ATIME ?m1 HUE 13:30HR)."""
+    pred: str
+    args: tuple
+    # Constant arguments by position, and positions taken by each variable
+    bound: dict = field(init=False, compare=False)
+    slots: dict = field(init=False, compare=False)
+
+    def __post_init__(self):
+        args = tuple(self.args)
+        slots = {}
+        for i, arg in enumerate(args):
+            if arg.startswith("?"):
+                slots.setdefault(arg, []).append(i)
+        object.__setattr__(self, "args", args)
+        object.__setattr__(self, "bound", {i: arg for i, arg in enumerate(args) if not arg.startswith("?")})
+        object.__setattr__(self, "slots", slots)
+
+    def const(self, i):
+        """Constant at position i, or None when it is a variable or missing."""
+        return self.bound.get(i)
+
+    def var(self, i):
+        """Variable name at position i, or None when it is a constant or missing."""
+        if i < len(self.args) and i not in self.bound:
+            return self.args[i]
+        return None
+
+    def __repr__(self):
+        return f"({' '.join((self.pred,) + self.args)})"
+
+@dataclass(frozen=True, slots=True, repr=False)
+class QueryPlan:
+    """Procedural form: command, output projection and conditions.
+
+    Built directly by the processor and compiled from procedural lists; plans are hashable and
+    equal plans share one answer cache entry.
+    """
+    command: str
+    output: tuple = ()
+    conditions: tuple = ()
+    error: str = None
+
+    def __post_init__(self):
+        object.__setattr__(self, "output", tuple(self.output))
+        object.__setattr__(self, "conditions", tuple(self.conditions))
+
+    def to_json(self):
+        return {"command": self.command, "output": list(self.output),
+                "conditions": [[c.pred, *c.args] for c in self.conditions], "error": self.error}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["command"], data["output"], [Condition(c[0], c[1:]) for c in data["conditions"]], data["error"])
+
+    def __repr__(self):
+        return f"QueryPlan({self.command}, {list(self.output)}, {list(self.conditions)})"
+
+def format_procedure(plan):
+    """Render a plan as the procedural form list, e.g. ["PRINT-ALL", "?m1", "(MÁY_BAY ?m1)"]."""
+    if plan.error:
+        return [plan.error]
+    return [plan.command, *plan.output, *map(repr, plan.conditions)]
+
+def normalize_procedure(procedure):
+    """Cache key for a procedural form: a tuple of whitespace-normalized parts."""
+    return tuple(" ".join(str(part).split()) for part in procedure)
+
+def parse_condition(condition):
+    """Parse a condition string into predicate and arguments."""
+    if not condition.startswith("(") or not condition.endswith(")"):
+        return None, []
+    parts = condition[1:-1].split()
+    if not parts:
+        return None, []
+    return parts[0], parts[1:]
+
+def compile_procedure(procedure):
+    """Compile a procedural form list such as ["PRINT-ALL", "?m1", "(MÁY_BAY ?m1)"] into a QueryPlan.
+
+    COUNT takes output variables like PRINT-ALL and answers with the number of distinct rows.
+    """
+    procedure = normalize_procedure(procedure)
+    if not procedure or procedure[0] not in ["PRINT-ALL", "VERIFY", "COUNT"]:
+        return QueryPlan(None, error="Invalid query")
+    # PRINT-ALL and COUNT project every leading ?variable, e.g. ["PRINT-ALL", "?m1", "?time", ...]
+    output = []
+    rest = procedure[1:]
+    if procedure[0] != "VERIFY":
+        while rest and rest[0].startswith("?"):
+            output.extend(rest[0].split())
+            rest = rest[1:]
+        if not output:
+            return QueryPlan(None, error="Invalid query")
+    conditions = []
+    for condition in rest:
+        pred, args = parse_condition(condition)
+        if pred:
+            conditions.append(Condition(pred, args))
+    return QueryPlan(procedure[0], output, conditions)
@@ -1,17 +1,104 @@
+from Models.lexicon import DATABASE_FILE, LEXICON_FILE
 from Models.parser import DependencyParser
-import re
+from Models.cache import ParseCache
+from Models.logical import Argument, Predicate, Which, logical_from_json, logical_to_json
+from Models.metrics import METRICS
+from Models.plan import Condition, QueryPlan
+from Models.templates import TemplateMatcher
+
+# Shape of the results kept in ParseCache; bump it when that shape changes so old entries are not reused
+RESULT_FORMAT = 3
+
+# Arc labels whose grammatical relation is just (RELATION, m1, DEP)
+DEPENDENT_RELATIONS = {"obj": "OBJ", "acl": "ACL", "discourse": "DISCOURSE", "aux": "AUX", "det": "DET",
+                       "question": "QUESTION", "mark": "MARK", "cop": "COP"}
+
+# Grammatical relations carried into the logical predicate as [ROLE VALUE] arguments
+LOGICAL_ROLES = frozenset(["NSUBJ", "TO-LOC", "FROM-LOC", "AT-TIME", "WH-TIME", "OBJ", "ACL", "NMOD",
+                           "DISCOURSE", "AUX", "DET", "MARK", "COP"])
 
 class QueryProcessor:
-    def __init__(self):
-        self.parser = DependencyParser()
+    def __init__(self, cache_size=1024, cache_path=None, database=DATABASE_FILE, lexicon=LEXICON_FILE, fast_path=None):
+        self.parser = DependencyParser(database, lexicon)
+        self.lexicon = self.parser.lexicon
+        self.cities = frozenset(self.lexicon.names("city"))
+        # Arc label -> handler(head, dep, grammatical, state) for labels that need more than DEPENDENT_RELATIONS
+        self.relations = {
+            "which": self.which_relation,
+            "nsubj": self.nsubj_relation,
+            "to-loc": self.to_loc_relation,
+            "nmod": self.nmod_relation,
+            "from-loc": self.from_loc_relation,
+            "at": self.at_relation,
+            "at-time": self.at_time_relation,
+            "wh-time": self.wh_time_relation,
+        }
+        # Results are memoized per normalized question; cache_path adds a sqlite store that survives restarts
+        self.cache = ParseCache(f"{RESULT_FORMAT}:{self.parser.fingerprint()}", cache_size, cache_path,
+                                 encode=encode_result, decode=decode_result, copy=copy_result) if cache_size else None
+        # Known question shapes are filled in from templates instead of parsed ("on"); "verify" also
+        # runs the full pipeline on every template hit and keeps its result
+        self.fast_path = fast_path
+        self.templates = TemplateMatcher(self.parser, self.run, encode_result, decode_result) if fast_path else None
+
+    def warm_up(self):
+        """Preload the NLP models so the first question does not pay for them."""
+        self.parser.warm_up()
+        if self.templates is not None and self.templates.templates is None:
+            with METRICS.timer("compile_templates"):
+                self.templates.compile()
 
     def process(self, query):
-        """Process query through all steps."""
-        tokens = self.parser.tokenize(query)
-        dependencies = self.parser.get_dependencies(query) or []
-        grammatical = self.dependencies_to_grammatical(dependencies, query)
-        logical = self.grammatical_to_logical(grammatical)
-        procedural = self.logical_to_procedural(logical, query)
+        """Process query through all steps, reusing cached results for repeated questions."""
+        with METRICS.timer("process"):
+            if self.cache is None and self.templates is None:
+                return self.run(query)
+            key = self.parser.normalize(" ".join(query.split()))
+            result = None
+            if self.cache is not None:
+                result = self.cache.get(key)
+                if METRICS.enabled:
+                    METRICS.count("parse_cache", 1, "miss" if result is None else "hit")
+            if result is None:
+                if self.templates is not None:
+                    result = self.from_template(key, query)
+                if result is None:
+                    result = self.run(query)
+                if self.cache is not None:
+                    self.cache.put(key, result)
+            return result
+
+    def close(self):
+        """Commit and close the parse cache's sqlite store."""
+        if self.cache is not None:
+            self.cache.close()
+
+    def from_template(self, key, query):
+        """Result for a normalized question of a known shape, or None; in verify mode it is checked
+        against the full pipeline, whose result is returned."""
+        with METRICS.timer("template_match"):
+            result = self.templates.match(key)
+        if METRICS.enabled:
+            METRICS.count("fast_path", 1, "miss" if result is None else "hit")
+        if result is None or self.fast_path != "verify":
+            return result
+        full = self.run(query)
+        if encode_result(full) != encode_result(result):
+            if METRICS.enabled:
+                METRICS.count("fast_path", 1, "mismatch")
+            print(f"Warning: Fast path result differs from the full pipeline for: {query}")
+            self.templates.reject(key)
+        return full
+
+    def run(self, query):
+        """Run the full NLP pipeline on a query without consulting the cache."""
+        tokens, dependencies = self.parser.parse(query)
+        with METRICS.timer("dependencies_to_grammatical"):
+            grammatical = self.dependencies_to_grammatical(dependencies, query)
+        with METRICS.timer("grammatical_to_logical"):
+            logical = self.grammatical_to_logical(grammatical)
+        with METRICS.timer("logical_to_procedural"):
+            procedural = self.logical_to_procedural(logical, query)
 
         return {
             "tokens": tokens,
@@ -22,130 +109,86 @@ class QueryProcessor:
         }
 
     def dependencies_to_grammatical(self, dependencies, query):
-        """Convert dependencies to grammatical relations as a list."""
+        """Convert (label, head, dep) arcs to grammatical relations as a list, one table lookup per arc."""
         grammatical = []
-        city_unit = None
-        for dep in dependencies or []:
-            if not isinstance(dep, str):
+        # Set by to-loc(x, thành phố) so that the following nmod(thành phố, city) names the destination
+        state = {"city_unit": False}
+        for arc in dependencies or []:
+            if len(arc) != 3:
                 continue
-            if "which" in dep:
-                parts = dep.split("(")[1].split(")")[0].split(", ")
-                grammatical.append(["WHICH", "m1", parts[0].upper()])
-            elif "nsubj" in dep:
-                parts = dep.split("(")[1].split(")")[0].split(", ")
-                grammatical.append(["PRED", "m1", parts[0].upper()])
-                if parts[1] == "thời gian":
-                    grammatical.append(["NSUBJ", "m1", parts[1].upper()])
-                else:
-                    grammatical.append(["LSUBJ", "m1", parts[1].upper()])
-            elif "to-loc" in dep:
-                parts = dep.split("(")[1].split(")")[0].split(", ")
-                if parts[1] == "thành phố":
-                    city_unit = "thành phố"
-                    continue
-                elif parts[0] != "đến" and parts[0] != "ra" and parts[0] in self.parser.cities:
-                    grammatical.append(["TO-LOC", "m1", parts[0].upper()])
-                elif (parts[0] == "đến" or parts[0] == "ra" or parts[0] == "hạ cánh" or parts[0] == "bay") and parts[1] in self.parser.cities:
-                    grammatical.append(["TO-LOC", "m1", parts[1].upper()])
+            label, head, dep = arc
+            relation = DEPENDENT_RELATIONS.get(label)
+            if relation:
+                grammatical.append([relation, "m1", dep.upper()])
                 continue
-            elif "nmod" in dep:
-                parts = dep.split("(")[1].split(")")[0].split(", ")
-                if parts[0] == "thành phố" and parts[1] in self.parser.cities:
-                    if city_unit:
-                        grammatical.append(["TO-LOC", "m1", f"THÀNH PHỐ-{parts[1].upper()}"])
-                        city_unit = None
-                else:
-                    grammatical.append(["NMOD", "m1", parts[1].upper()])
-            elif "from-loc" in dep:
-                parts = dep.split("(")[1].split(")")[0].split(", ")
-                if parts[0] == "từ" and parts[1] in self.parser.cities:
-                    grammatical.append(["FROM-LOC", "m1", parts[1].upper()])
-                elif parts[1] == "từ" and parts[0] in self.parser.cities:
-                    grammatical.append(["FROM-LOC", "m1", parts[0].upper()])
-                elif parts[0] in ["xuất phát", "bay"] and parts[1] in self.parser.cities:
-                    grammatical.append(["FROM-LOC", "m1", parts[1].upper()])
-            elif "at(" in dep:
-                parts = dep.split("(")[1].split(")")[0].split(", ")
-                grammatical.append(["AT-TIME", "m1", parts[0].upper()])
-            elif "at-time(" in dep:
-                parts = dep.split("(")[1].split(")")[0].split(", ")
-                grammatical.append(["AT-TIME", "m1", parts[1].upper()])
-            elif "wh-time" in dep:
-                parts = dep.split("(")[1].split(")")[0].split(", ")
-                if parts[1] == "mất" or parts[1] == "bao lâu":
-                    grammatical.append(["WH-TIME", "m1", parts[0].upper()])
-            elif "obj" in dep:
-                parts = dep.split("(")[1].split(")")[0].split(", ")
-                grammatical.append(["OBJ", "m1", parts[1].upper()])
-            elif "acl" in dep:
-                parts = dep.split("(")[1].split(")")[0].split(", ")
-                grammatical.append(["ACL", "m1", parts[1].upper()])
-            elif "discourse" in dep:
-                parts = dep.split("(")[1].split(")")[0].split(", ")
-                grammatical.append(["DISCOURSE", "m1", parts[1].upper()])
-            elif "aux" in dep:
-                parts = dep.split("(")[1].split(")")[0].split(", ")
-                grammatical.append(["AUX", "m1", parts[1].upper()])
-            elif "det" in dep:
-                parts = dep.split("(")[1].split(")")[0].split(", ")
-                grammatical.append(["DET", "m1", parts[1].upper()])
-            elif "question" in dep:
-                parts = dep.split("(")[1].split(")")[0].split(", ")
-                grammatical.append(["QUESTION", "m1", parts[1].upper()])
-            elif "mark" in dep:
-                parts = dep.split("(")[1].split(")")[0].split(", ")
-                grammatical.append(["MARK", "m1", parts[1].upper()])
-            elif "cop" in dep:
-                parts = dep.split("(")[1].split(")")[0].split(", ")
-                grammatical.append(["COP", "m1", parts[1].upper()])
+            handler = self.relations.get(label)
+            if handler:
+                handler(head, dep, grammatical, state)
         return grammatical
 
+    def which_relation(self, head, dep, grammatical, state):
+        grammatical.append(["WHICH", "m1", head.upper()])
+
+    def nsubj_relation(self, head, dep, grammatical, state):
+        grammatical.append(["PRED", "m1", head.upper()])
+        grammatical.append(["NSUBJ" if dep == "thời gian" else "LSUBJ", "m1", dep.upper()])
+
+    def to_loc_relation(self, head, dep, grammatical, state):
+        if dep == "thành phố":
+            state["city_unit"] = True
+        elif head not in ("đến", "ra") and head in self.cities:
+            grammatical.append(["TO-LOC", "m1", head.upper()])
+        elif head in ("đến", "ra", "hạ cánh", "bay") and dep in self.cities:
+            grammatical.append(["TO-LOC", "m1", dep.upper()])
+
+    def nmod_relation(self, head, dep, grammatical, state):
+        if head == "thành phố" and dep in self.cities:
+            if state["city_unit"]:
+                grammatical.append(["TO-LOC", "m1", f"THÀNH PHỐ-{dep.upper()}"])
+                state["city_unit"] = False
+        else:
+            grammatical.append(["NMOD", "m1", dep.upper()])
+
+    def from_loc_relation(self, head, dep, grammatical, state):
+        if head == "từ" and dep in self.cities:
+            grammatical.append(["FROM-LOC", "m1", dep.upper()])
+        elif dep == "từ" and head in self.cities:
+            grammatical.append(["FROM-LOC", "m1", head.upper()])
+        elif head in ("xuất phát", "bay") and dep in self.cities:
+            grammatical.append(["FROM-LOC", "m1", dep.upper()])
+
+    def at_relation(self, head, dep, grammatical, state):
+        grammatical.append(["AT-TIME", "m1", head.upper()])
+
+    def at_time_relation(self, head, dep, grammatical, state):
+        grammatical.append(["AT-TIME", "m1", dep.upper()])
+
+    def wh_time_relation(self, head, dep, grammatical, state):
+        if dep in ("mất", "bao lâu"):
+            grammatical.append(["WH-TIME", "m1", head.upper()])
+
     def grammatical_to_logical(self, grammatical):
-        """Convert grammatical relations to logical form as a list."""
+        """Convert grammatical relations to logical forms: an optional Which and the main Predicate."""
         logical = []
         pred = None
         args = []
         for g in grammatical:
             if g[0] == "WHICH":
-                logical.append(f"(m1 WHICH {g[2]})")
+                logical.append(Which(g[2]))
             elif g[0] == "PRED":
                 pred = g[2]
             elif g[0] == "LSUBJ":
-                args.append("[MÁY BAY]")
-            elif g[0] == "NSUBJ":
-                args.append(f"[NSUBJ {g[2]}]")
-            elif g[0] == "TO-LOC":
-                args.append(f"[TO-LOC {g[2]}]")
-            elif g[0] == "FROM-LOC":
-                args.append(f"[FROM-LOC {g[2]}]")
-            elif g[0] == "AT-TIME":
-                args.append(f"[AT-TIME {g[2]}]")
-            elif g[0] == "WH-TIME":
-                args.append(f"[WH-TIME {g[2]}]")
-            elif g[0] == "OBJ":
-                args.append(f"[OBJ {g[2]}]")
-            elif g[0] == "ACL":
-                args.append(f"[ACL {g[2]}]")
-            elif g[0] == "NMOD":
-                args.append(f"[NMOD {g[2]}]")
-            elif g[0] == "DISCOURSE":
-                args.append(f"[DISCOURSE {g[2]}]")
-            elif g[0] == "AUX":
-                args.append(f"[AUX {g[2]}]")
-            elif g[0] == "DET":
-                args.append(f"[DET {g[2]}]")
-            elif g[0] == "MARK":
-                args.append(f"[MARK {g[2]}]")
-            elif g[0] == "COP":
-                args.append(f"[COP {g[2]}]")
+                args.append(Argument(None, "MÁY BAY"))
+            elif g[0] in LOGICAL_ROLES:
+                args.append(Argument(g[0], g[2]))
         if pred:
-            logical.append(f"(m1 PRED {pred} {' '.join(args)})")
+            logical.append(Predicate(pred, tuple(args)))
         return logical
 
     def logical_to_procedural(self, logical, query):
-        """Convert logical form to procedural form as a list."""
+        """Convert logical forms to a QueryPlan."""
         if not logical:
-            return ["Invalid query"]
+            return QueryPlan(None, error="Invalid query")
         
         conditions = []
         var = "?m1"
@@ -161,43 +204,40 @@ class QueryProcessor:
         is_duration_query = False
         airline = None
         
-        for l in logical:
-            which_match = re.search(r"\(m1 WHICH ([^\)]+)\)", l)
-            nmod_match = re.search(r"\[NMOD ([^\]\[]+)\]", l)
-            from_match = re.search(r"\[FROM-LOC ([^\]\[]+)\]", l)
-            to_match = re.search(r"\[TO-LOC ([^\]\[]+)\]", l)
-            time_match = re.search(r"\[(?:AT-TIME|WH-TIME) ([^\]\[]+)\]", l)
-            nsubj_match = re.search(r"\[NSUBJ THỜI GIAN\]", l)
-            
-            if which_match:
+        for form in logical:
+            if isinstance(form, Which):
                 has_which = True
-                which_target = which_match.group(1).strip()
-            if nmod_match:
-                nmod_value = nmod_match.group(1).strip()
-                if nmod_value in ["VN1", "VN2", "VN3", "VN4", "VN5", "VJ1", "VJ2", "VJ3", "VJ4", "VJ5"]:
+                which_target = form.target
+                continue
+            nmod_value = form.first("NMOD")
+            if nmod_value:
+                if self.lexicon.lookup(nmod_value, "plane"):
                     plane = nmod_value
                 else:
                     airline = nmod_value
-            if from_match:
-                source = from_match.group(1).strip()
-            if to_match:
-                dest = to_match.group(1).strip()
-            if time_match:
-                time = time_match.group(1).strip()
-            if nsubj_match:
+            source = form.first("FROM-LOC") or source
+            dest = form.first("TO-LOC") or dest
+            time = form.first("AT-TIME", "WH-TIME") or time
+            if any(arg.role == "NSUBJ" and arg.value == "THỜI GIAN" for arg in form.args):
                 is_duration_query = True
         
+        # Airline-only questions name no city; one whose cities were lost by the parse is not one
+        airline_code = self.lexicon.code(airline, "airline") if airline else None
+        if airline_code and self.lexicon.mentions(query, "city"):
+            airline_code = None
+
         # Handle airline-only query (e.g., Query 10)
-        if has_which and which_target == "MÁY BAY" and airline == "VIETJET AIR" and not (source or dest or time):
-            conditions.append("(MÁY_BAY ?m1 VJ)")
-            return ["PRINT-ALL", "?m1"] + conditions
+        if has_which and which_target == "MÁY BAY" and airline_code and not (source or dest or time):
+            conditions.append(Condition("MÁY_BAY", ("?m1", airline_code)))
+            return QueryPlan("PRINT-ALL", ("?m1",), conditions)
         
         # Handle city query for airline (e.g., Query 9)
-        if has_which and which_target == "THÀNH PHỐ" and airline == "VIETJET AIR" and not (source or time):
+        if has_which and which_target == "THÀNH PHỐ" and airline_code and not (source or time):
             dest_arg = "?dest"
             time_arg = "?time"
-            conditions.append(f"(ATIME VJ {dest_arg} {time_arg})")
-            return ["PRINT-ALL", "?dest"] + conditions
+            conditions.append(Condition("MÁY_BAY", (var, airline_code)))
+            conditions.append(Condition("ATIME", (var, dest_arg, time_arg)))
+            return QueryPlan("PRINT-ALL", ("?dest",), conditions)
         
         # Determine database predicate based on FROM-LOC and TO-LOC
         db_pred = None
@@ -209,32 +249,67 @@ class QueryProcessor:
             db_pred = "RUN-TIME"
         
         if not db_pred:
-            return ["Invalid query"]
+            return QueryPlan(None, error="Invalid query")
         
         # Construct predicate with fixed argument count
         if db_pred == "DTIME":
             plane_arg = plane if plane else "?m1"
-            source_arg = self.parser.city_mappings.get(source.title(), source) if source else "?source"
+            source_arg = self.lexicon.code(source, "city", source) if source else "?source"
             time_arg = "?time" if time == "MẤY GIỜ" or not time else time
-            conditions.append(f"(DTIME {plane_arg} {source_arg} {time_arg})")
+            conditions.append(Condition("DTIME", (plane_arg, source_arg, time_arg)))
         elif db_pred == "ATIME":
             plane_arg = plane if plane else "?m1"
-            dest_arg = self.parser.city_mappings.get(dest.title(), dest) if dest else "?dest"
+            dest_arg = self.lexicon.code(dest, "city", dest) if dest else "?dest"
             time_arg = "?time" if time == "MẤY GIỜ" or not time else time
-            conditions.append(f"(ATIME {plane_arg} {dest_arg} {time_arg})")
+            conditions.append(Condition("ATIME", (plane_arg, dest_arg, time_arg)))
         elif db_pred == "RUN-TIME":
             plane_arg = plane if plane else "?m1"
-            source_arg = self.parser.city_mappings.get(source.title(), source) if source else "?source"
-            dest_arg = self.parser.city_mappings.get(dest.title(), dest) if dest else "?dest"
+            source_arg = self.lexicon.code(source, "city", source) if source else "?source"
+            dest_arg = self.lexicon.code(dest, "city", dest) if dest else "?dest"
             time_arg = "?time" if time == "MẤY GIỜ" or not time else time
-            conditions.append(f"(RUN-TIME {plane_arg} {source_arg} {dest_arg} {time_arg})")
+            conditions.append(Condition("RUN-TIME", (plane_arg, source_arg, dest_arg, time_arg)))
         
-        # Set output variable and add MÁY_BAY condition
+        # Set output variables and add MÁY_BAY condition
+        asks_time = time == "MẤY GIỜ"
         if is_duration_query and db_pred == "RUN-TIME":
             output_var = "?time"
         elif has_which and which_target == "THÀNH PHỐ":
             output_var = "?dest"
+        elif plane:
+            # Known plane: ask for its time, or verify the fact (e.g. Query 6)
+            if not asks_time:
+                return QueryPlan("VERIFY", (), conditions)
+            output_var = "?time"
         else:
-            conditions.insert(0, f"(MÁY_BAY {var})")
+            conditions.insert(0, Condition("MÁY_BAY", (var,)))
+            if asks_time:
+                return QueryPlan("PRINT-ALL", (output_var, "?time"), conditions)
         
-        return ["PRINT-ALL", output_var] + conditions
\ No newline at end of file
+        return QueryPlan("PRINT-ALL", (output_var,), conditions)
+
+def encode_result(result):
+    """JSON-ready copy of a pipeline result for the sqlite parse cache."""
+    return {**result, "logical": logical_to_json(result["logical"]), "procedural": result["procedural"].to_json()}
+
+def copy_result(result):
+    """Copy of a pipeline result that shares only its immutable parts (strings, tuples, logical and plan objects)."""
+    return {**result, "tokens": list(result["tokens"]), "dependencies": list(result["dependencies"]),
+            "grammatical": [list(relation) for relation in result["grammatical"]], "logical": list(result["logical"])}
+
+def decode_result(data):
+    return {**data, "dependencies": [tuple(arc) for arc in data["dependencies"]],
+            "logical": logical_from_json(data["logical"]), "procedural": QueryPlan.from_json(data["procedural"])}
+
+# Per-process processor for executor pools, built once by init_worker so each worker loads the NLP models a single time
+_processor = None
+
+def init_worker(cache_path=None, database=DATABASE_FILE, lexicon=LEXICON_FILE, fast_path=None):
+    from multiprocessing.util import Finalize
+    global _processor
+    _processor = QueryProcessor(cache_path=cache_path, database=database, lexicon=lexicon, fast_path=fast_path)
+    _processor.warm_up()
+    # Pool workers leave without running atexit hooks, but they do run multiprocessing finalizers
+    Finalize(_processor, _processor.close, exitpriority=10)
+
+def process_query(query):
+    return _processor.process(query)
@@ -0,0 +1,212 @@
+from bisect import bisect_left
+from heapq import heappop, heappush
+from Models.cache import AnswerCache
+from Models.columns import minutes_to_time
+
+# Shortest time between landing and taking off again at a connecting city, in minutes
+MIN_CONNECTION = 30
+
+class RouteGraph:
+    """Flights of one database version as a connection graph: one node per RUN-TIME leg.
+
+    A leg departs at its DTIME and lands at its ATIME for the same plane and city; a missing one
+    is derived from the RUN-TIME duration, and a leg with neither time can connect at any time.
+    Legs leaving each city are kept sorted by departure so that the legs reachable after a
+    landing are found by bisect.
+    """
+
+    def __init__(self, db, version=None):
+        depart = self.times(db.data["DTIME"], version)
+        arrive = self.times(db.data["ATIME"], version)
+        run_time = db.data["RUN-TIME"]
+        planes, sources, dests = run_time.data["plane"], run_time.data["source"], run_time.data["dest"]
+        legs = []
+        for i in run_time.select({}, version):
+            plane, source, dest = planes[i], sources[i], dests[i]
+            duration = run_time.minutes[i]
+            start = depart.get((plane, source))
+            end = arrive.get((plane, dest))
+            if start is None and end is not None:
+                start = end - duration
+            elif end is None and start is not None:
+                end = start + duration
+            legs.append((start, plane, source, dest, end, duration if start is None or end < start else end - start))
+        # Timed legs by departure first; untimed ones (start None) go last
+        legs.sort(key=lambda leg: (leg[0] is None, leg[0] or 0))
+        self.plane = [leg[1] for leg in legs]
+        self.source = [leg[2] for leg in legs]
+        self.dest = [leg[3] for leg in legs]
+        self.depart = [leg[0] for leg in legs]
+        self.arrive = [leg[4] for leg in legs]
+        self.length = [leg[5] for leg in legs]
+        # City code -> leg ids leaving it (by departure), and their departures for bisect
+        self.leaving = {}
+        for leg, city in enumerate(self.source):
+            self.leaving.setdefault(city, []).append(leg)
+        self.departures = {city: [self.depart[leg] for leg in ids if self.depart[leg] is not None]
+                           for city, ids in self.leaving.items()}
+
+    @staticmethod
+    def times(table, version):
+        """{(plane, city): minutes} for the live facts of a DTIME or ATIME table."""
+        planes, cities, minutes = table.data["plane"], table.data["city"], table.minutes
+        return {(planes[i], cities[i]): minutes[i] for i in table.select({}, version) if minutes[i] >= 0}
+
+    def next_legs(self, city, arrival, min_connection):
+        """Legs leaving city that can be caught after landing at arrival (None: any time)."""
+        ids = self.leaving.get(city, ())
+        if arrival is None or not ids:
+            return ids
+        timed = self.departures[city]
+        # Untimed legs sit after the timed ones and can always be caught
+        return ids[bisect_left(timed, arrival + min_connection):]
+
+    def shortest(self, source, min_connection=MIN_CONNECTION):
+        """Fastest routes from source to every reachable city, by elapsed time from first takeoff to last landing.
+
+        Dijkstra over legs: catching leg b after leg a costs the wait at the connecting city plus
+        b's flight time. Returns {city: (minutes, last leg)} and the parent leg of every settled leg.
+        """
+        heap = []
+        for leg in self.leaving.get(source, ()):
+            heappush(heap, (self.length[leg], leg, -1))
+        parents = {}
+        best = {}
+        # Per city, (arrival, minutes - arrival) of legs already expanded there: a later leg that
+        # lands no earlier with no smaller offset can only reach what they reached, no sooner
+        expanded = {}
+        while heap:
+            cost, leg, parent = heappop(heap)
+            if leg in parents:
+                continue
+            parents[leg] = parent
+            city, arrival = self.dest[leg], self.arrive[leg]
+            if city == source:
+                continue
+            if city not in best:
+                best[city] = (cost, leg)
+            if arrival is not None:
+                offset = cost - arrival
+                seen = expanded.setdefault(city, [])
+                if any(other <= arrival and offset_other <= offset for other, offset_other in seen):
+                    continue
+                seen.append((arrival, offset))
+            for nxt in self.next_legs(city, arrival, min_connection):
+                if nxt in parents:
+                    continue
+                start = self.depart[nxt]
+                wait = start - arrival if start is not None and arrival is not None else 0
+                heappush(heap, (cost + wait + self.length[nxt], nxt, leg))
+        return best, parents
+
+    def legs(self, leg, parents):
+        """Legs of the route ending with leg, in flight order."""
+        route = []
+        while leg != -1:
+            route.append(leg)
+            leg = parents[leg]
+        return route[::-1]
+
+class RouteStrings:
+    """Strings of one query: the database's plus the route texts and durations it found.
+
+    A found text that the database does not hold gets a negative code here instead of being
+    interned into the shared StringTable, so route outputs never outlive the query.
+    """
+
+    def __init__(self, strings):
+        self.strings = strings
+        self.codes = {}
+        self.texts = []
+
+    def intern(self, text):
+        code = self.strings.code(text)
+        if code is None:
+            code = self.codes.get(text)
+        if code is None:
+            code = self.codes[text] = ~len(self.texts)
+            self.texts.append(text)
+        return code
+
+    def __getitem__(self, code):
+        return self.strings[code] if code >= 0 else self.texts[~code]
+
+class RoutePlanner:
+    """Answer ROUTE conditions from a RouteGraph rebuilt when the flight tables change.
+
+    Single-source results are kept in a bounded LRU cache per (source, connection time), so the
+    frequent departure cities have their shortest routes to every destination precomputed.
+    """
+
+    TABLES = ("RUN-TIME", "DTIME", "ATIME")
+
+    def __init__(self, db, cache_size=128, min_connection=MIN_CONNECTION):
+        self.db = db
+        self.min_connection = min_connection
+        self.graph = None
+        self.graph_stamp = None
+        self.cache = AnswerCache(cache_size)
+
+    def stamp(self):
+        return tuple(self.db.data[pred].version for pred in self.TABLES)
+
+    def routes(self, source, version):
+        """Graph and {city: (minutes, last leg)}, parents from source at version."""
+        stamp = self.stamp()
+        if max(stamp) > version:
+            # Tables changed after the query pinned its version: plan on a private graph
+            graph = RouteGraph(self.db, version)
+            return graph, graph.shortest(source, self.min_connection)
+        if self.graph_stamp != stamp:
+            self.graph, self.graph_stamp = RouteGraph(self.db, version), stamp
+        graph = self.graph
+        key = (source, self.min_connection)
+        found = self.cache.get(key, stamp)
+        if found is None:
+            found = graph.shortest(source, self.min_connection)
+            self.cache.put(key, stamp, found)
+        return graph, found
+
+    def describe(self, graph, leg, parents):
+        """Route text such as VN3(HCMC-HP) VJ9(HP-HUE)."""
+        strings = self.db.strings
+        return " ".join(f"{strings[graph.plane[i]]}({strings[graph.source[i]]}-{strings[graph.dest[i]]})"
+                        for i in graph.legs(leg, parents))
+
+    def matches(self, condition, binding, version, found_strings):
+        """Bindings (as codes) of (ROUTE source dest ?route ?time) given the variables bound so far.
+
+        Route texts and durations are coded by found_strings, a RouteStrings of the query.
+        """
+        strings = self.db.strings
+        ends = []
+        for i in (0, 1):
+            var = condition.var(i)
+            ends.append(binding.get(var) if var else strings.code(condition.const(i)))
+            if var is None and ends[-1] is None:
+                return []
+        source, dest = ends
+        if source is None:
+            return []
+        graph, (best, parents) = self.routes(source, version)
+        results = []
+        for city in [dest] if dest is not None else best:
+            if city not in best:
+                continue
+            minutes, leg = best[city]
+            found = {0: source, 1: city}
+            texts = {2: self.describe(graph, leg, parents), 3: minutes_to_time(minutes)}
+            if any(condition.const(i) not in (None, text) for i, text in texts.items()):
+                continue
+            found.update((i, found_strings.intern(text)) for i, text in texts.items() if condition.var(i))
+            match = {}
+            for i, code in found.items():
+                var = condition.var(i)
+                if var is None:
+                    continue
+                if binding.get(var, code) != code or match.get(var, code) != code:
+                    break
+                match[var] = code
+            else:
+                results.append(match)
+        return results
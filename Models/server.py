@@ -0,0 +1,191 @@
+import asyncio
+import json
+import signal
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from urllib.parse import parse_qs, urlsplit
+from Models.metrics import METRICS
+from Models.lexicon import DATABASE_FILE, LEXICON_FILE
+from Models.output import result_record
+from Models.processor import QueryProcessor, init_worker, process_query
+
+class Text(str):
+    """Payload sent as plain text rather than JSON."""
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+class QueryServer:
+    """Answer questions over HTTP with a pipeline and database loaded once.
+
+    GET /query?q=... or POST /query with {"question": ...} returns every pipeline stage and the answer as JSON.
+    /rows takes the same question plus limit, offset and ordered, and streams answer rows as JSON lines.
+    /metrics exposes the stage timers and counters in Prometheus text format (or JSON with format=json).
+    Parsing runs in an executor: one thread sharing this process's QueryProcessor, or a process pool when workers > 0.
+    """
+
+    def __init__(self, db, processor=None, workers=0, cache_path=None, database=DATABASE_FILE, lexicon=LEXICON_FILE,
+                 fast_path=None, max_body=1 << 16):
+        self.db = db
+        self.workers = workers
+        # Largest request body read, in bytes; a question needs far less
+        self.max_body = max_body
+        if workers:
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                                initargs=(cache_path, database, lexicon, fast_path))
+            self.process = process_query
+        else:
+            # QueryProcessor and its caches are not thread-safe, so a single thread serves all parses
+            self.processor = processor or QueryProcessor(cache_path=cache_path, database=database, lexicon=lexicon,
+                                                         fast_path=fast_path)
+            self.executor = ThreadPoolExecutor(max_workers=1)
+            self.process = self.processor.process
+
+    async def warm_up(self):
+        """Load the NLP models in every executor worker before taking traffic."""
+        loop = asyncio.get_running_loop()
+        if self.workers:
+            await asyncio.gather(*(loop.run_in_executor(self.executor, process_query, "Máy bay nào đến Huế ?")
+                                   for _ in range(self.workers)))
+        else:
+            await loop.run_in_executor(self.executor, self.processor.warm_up)
+
+    async def answer(self, question):
+        """Run the pipeline on a question in the executor and look up its answer."""
+        with METRICS.timer("request"):
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, self.process, question)
+            return result_record(question, result, self.db.query(result["procedural"]))
+
+    async def route(self, method, target, body):
+        """Dispatch one request, returning (status, payload)."""
+        url = urlsplit(target)
+        if url.path == "/metrics":
+            if parse_qs(url.query).get("format", [""])[0] == "json":
+                return 200, METRICS.to_json()
+            return 200, Text(METRICS.to_prometheus())
+        if url.path == "/health":
+            return 200, {"status": "ok", "version": self.db.version,
+                         "answers": self.db.answers.stats(), "plans": self.db.plans.stats()}
+        if url.path not in ("/query", "/rows"):
+            return 404, {"error": "not found"}
+        params = parse_qs(url.query)
+        if method == "GET":
+            question = params.get("q", [""])[0]
+        elif method == "POST":
+            try:
+                question = json.loads(body or b"{}").get("question", "")
+            except (ValueError, AttributeError):
+                return 400, {"error": "body must be a JSON object"}
+        else:
+            return 405, {"error": "use GET or POST"}
+        if not isinstance(question, str) or not question.strip():
+            return 400, {"error": "missing question"}
+        if url.path == "/rows":
+            try:
+                limit = int(params["limit"][0]) if "limit" in params else None
+                offset = int(params.get("offset", ["0"])[0])
+            except ValueError:
+                return 400, {"error": "limit and offset must be integers"}
+            if limit is not None and limit < 0 or offset < 0:
+                return 400, {"error": "limit and offset must not be negative"}
+            ordered = params.get("ordered", ["0"])[0].lower() not in ("", "0", "false")
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, self.process, question.strip())
+            return 200, self.db.stream(result["procedural"], limit, offset, ordered)
+        return 200, await self.answer(question.strip())
+
+    async def handle(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection, keeping it alive until the client closes it."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "malformed request line"}, False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get("content-length", 0) or 0)
+                except ValueError:
+                    length = -1
+                # The body of a rejected request is left unread, so the connection cannot be reused
+                if length < 0:
+                    await self.respond(writer, 400, {"error": "malformed Content-Length"}, False)
+                    break
+                if length > self.max_body:
+                    await self.respond(writer, 413, {"error": f"body larger than {self.max_body} bytes"}, False)
+                    break
+                body = await reader.readexactly(length)
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                try:
+                    status, payload = await self.route(method, target, body)
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+                if isinstance(payload, (dict, Text)):
+                    await self.respond(writer, status, payload, keep_alive)
+                else:
+                    await self.respond_stream(writer, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive):
+        if isinstance(payload, Text):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json"
+        head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                f"Content-Type: {content_type}; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def respond_stream(self, writer, rows, keep_alive, batch=256):
+        """Send rows as JSON lines in chunked transfer encoding, draining after every batch of rows."""
+        head = ("HTTP/1.1 200 OK\r\n"
+                "Content-Type: application/x-ndjson; charset=utf-8\r\n"
+                "Transfer-Encoding: chunked\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1"))
+        while True:
+            lines = [json.dumps(row, ensure_ascii=False) + "\n" for row in islice(rows, batch)]
+            if not lines:
+                break
+            data = "".join(lines).encode("utf-8")
+            writer.write(f"{len(data):X}\r\n".encode("latin-1") + data + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def serve(self, host="127.0.0.1", port=8080):
+        await self.warm_up()
+        server = await asyncio.start_server(self.handle, host, port)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, server.close)
+            except (NotImplementedError, RuntimeError):
+                pass
+        print(f"Serving on http://{host}:{port}/query")
+        async with server:
+            try:
+                await server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    def close(self):
+        self.executor.shutdown()
+        if not self.workers:
+            self.processor.close()
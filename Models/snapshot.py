@@ -0,0 +1,197 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import MutableMapping
+from Models.columns import ColumnTable, StringTable
+
+MAGIC = b"FLDB"
+VERSION = 1
+# Magic, format version and length of the JSON header that follows
+PREFIX = struct.Struct("<4sII")
+ITEMSIZE = array("i").itemsize
+
+class PostingIndex(MutableMapping):
+    """Index over sorted keys in CSR form: key k owns rows[offsets[k]:offsets[k + 1]].
+
+    Keys are found by binary search, so opening a snapshot does no per-key work. Posting lists
+    assigned later (by appends to the table) are kept in a small dict that overrides the mapped ones.
+    """
+
+    def __init__(self, codes, offsets, rows, width=1):
+        self.codes = codes
+        self.offsets = offsets
+        self.rows = rows
+        self.width = width
+        self.changed = {}
+        self.added = 0
+
+    def key(self, k):
+        if self.width == 1:
+            return self.codes[k]
+        return tuple(self.codes[k * self.width:(k + 1) * self.width])
+
+    def find(self, key):
+        """Position of key among the mapped keys, or None."""
+        try:
+            if self.width == 1:
+                k = bisect_left(self.codes, key)
+            else:
+                k = bisect_left(range(len(self.offsets) - 1), key, key=self.key)
+        except TypeError:
+            return None
+        if k == len(self.offsets) - 1 or self.key(k) != key:
+            return None
+        return k
+
+    def __len__(self):
+        return len(self.offsets) - 1 + self.added
+
+    def __iter__(self):
+        for k in range(len(self.offsets) - 1):
+            yield self.key(k)
+        for key in self.changed:
+            if self.find(key) is None:
+                yield key
+
+    def __getitem__(self, key):
+        if key in self.changed:
+            return self.changed[key]
+        k = self.find(key)
+        if k is None:
+            raise KeyError(key)
+        return self.rows[self.offsets[k]:self.offsets[k + 1]]
+
+    def __setitem__(self, key, rows):
+        if key not in self.changed and self.find(key) is None:
+            self.added += 1
+        self.changed[key] = rows
+
+    def __delitem__(self, key):
+        raise TypeError("posting lists of a snapshot cannot be removed")
+
+    def add(self, key, row_id):
+        """Append a row id to key's posting list, copying a mapped list into an override first."""
+        rows = self.get(key)
+        if not isinstance(rows, array):
+            rows = self[key] = array("i", rows or ())
+        rows.append(row_id)
+
+def is_fresh(snapshot, source):
+    """True when the snapshot exists and is at least as new as its text source."""
+    if not os.path.exists(snapshot):
+        return False
+    return not os.path.exists(source) or os.path.getmtime(snapshot) >= os.path.getmtime(source)
+
+def write_snapshot(strings, tables, path):
+    """Write the string table and column tables to path, replacing it atomically."""
+    sections = []
+    offset = 0
+
+    def add(values):
+        # Every section is an int array; offsets are counted in bytes from the end of the header
+        nonlocal offset
+        data = array("i", values).tobytes()
+        sections.append(data)
+        start, offset = offset, offset + len(data)
+        return [start, len(data) // ITEMSIZE]
+
+    blob = "\0".join(strings.strings).encode("utf-8")
+    header = {"byteorder": sys.byteorder, "itemsize": ITEMSIZE, "strings": len(strings.strings), "tables": {},
+              "order": add(sorted(range(len(strings.strings)), key=strings.strings.__getitem__))}
+    for pred, table in tables.items():
+        meta = {"columns": {column: add(table.data[column]) for column in table.columns},
+                "composite": table.composite,
+                "minutes": add(table.minutes) if table.minutes is not None else None,
+                "index": {}}
+        for name, index in table.index.items():
+            keys = sorted(index)
+            flat = [code for key in keys for code in key] if name in table.composite else keys
+            offsets = [0]
+            rows = array("i")
+            for key in keys:
+                rows.extend(index[key])
+                offsets.append(len(rows))
+            meta["index"][name] = {"keys": add(flat), "offsets": add(offsets), "rows": add(rows),
+                                   "width": len(table.composite.get(name, (None,)))}
+        header["tables"][pred] = meta
+    header["blob"] = [offset, len(blob)]
+    sections.append(blob)
+
+    head = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    # Pad so that the int sections start on an aligned boundary
+    head += b" " * (-(PREFIX.size + len(head)) % 8)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(PREFIX.pack(MAGIC, VERSION, len(head)))
+        f.write(head)
+        for data in sections:
+            f.write(data)
+    # Readers that already mapped the old file keep their pages; new readers see the new one
+    os.replace(tmp, path)
+
+def load_snapshot(path, columns):
+    """Map a snapshot read-only, returning (mapping, StringTable, {pred: ColumnTable}) or None if unusable.
+
+    Columns and posting lists are memoryviews into the mapping, so processes opening the same
+    snapshot share its pages through the OS page cache. A truncated or corrupt snapshot is
+    reported and treated as unusable; the mapping is closed whenever None is returned.
+    """
+    try:
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        loaded = read_snapshot(mapped, columns)
+    except (ValueError, TypeError, KeyError, IndexError, struct.error) as error:
+        print(f"Warning: Snapshot {path} is corrupt ({error!r}). Ignoring it.")
+        loaded = None
+    if loaded is None:
+        # The views into the mapping died with read_snapshot's frame, so it can be closed
+        mapped.close()
+        return None
+    return (mapped, *loaded)
+
+def read_snapshot(mapped, columns):
+    """StringTable and {pred: ColumnTable} over a mapped snapshot, or None for another format,
+    platform or set of predicates; raises on a truncated or corrupt one."""
+    magic, version, size = PREFIX.unpack_from(mapped)
+    if magic != MAGIC or version != VERSION:
+        return None
+    header = json.loads(bytes(mapped[PREFIX.size:PREFIX.size + size]))
+    if header["byteorder"] != sys.byteorder or header["itemsize"] != ITEMSIZE:
+        return None
+    body = memoryview(mapped)[PREFIX.size + size:]
+
+    def part(start, length):
+        if start < 0 or length < 0 or start + length > len(body):
+            raise ValueError(f"section {start}+{length} runs past the end of the snapshot")
+        return body[start:start + length]
+
+    def view(section):
+        start, length = section
+        return part(start, length * ITEMSIZE).cast("i")
+
+    text = bytes(part(*header["blob"])).decode("utf-8")
+    strings = StringTable.from_list(text.split("\0") if header["strings"] else [], view(header["order"]))
+    if len(strings.strings) != header["strings"] or len(strings.order) != header["strings"]:
+        raise ValueError("string table does not match its header")
+    tables = {}
+    for pred, meta in header["tables"].items():
+        if pred not in columns:
+            return None
+        data = {column: view(section) for column, section in meta["columns"].items()}
+        if set(data) != set(columns[pred]):
+            raise ValueError(f"{pred} has columns {sorted(data)}")
+        index = {name: PostingIndex(view(spec["keys"]), view(spec["offsets"]), view(spec["rows"]), spec["width"])
+                 for name, spec in meta["index"].items()}
+        composite = {name: tuple(parts) for name, parts in meta["composite"].items()}
+        minutes = view(meta["minutes"]) if meta["minutes"] else None
+        tables[pred] = ColumnTable.from_arrays(columns[pred], strings, data, index, minutes, composite)
+    if set(tables) != set(columns):
+        return None
+    return strings, tables
@@ -0,0 +1,141 @@
+import re
+from itertools import islice, product
+
+# Golden questions whose shapes are compiled into templates
+TEMPLATE_FILE = "input/query.txt"
+
+# A time as left by normalization, e.g. 13:30HR
+TIME_SLOT = re.compile(r"(?<![\d:])\d{1,2}:\d{2}HR")
+
+def probes(slot):
+    """Two distinct times to try in time slot number slot while compiling."""
+    return f"{23 - slot % 12}:59HR", f"{slot % 12}:05HR"
+
+def abstract(data, values):
+    """Copy of JSON-ready data with every string equal to values[i] replaced by slot marker i."""
+    if isinstance(data, str):
+        return f"\0{values.index(data)}" if data in values else data
+    if isinstance(data, list):
+        return [abstract(item, values) for item in data]
+    if isinstance(data, dict):
+        return {key: abstract(item, values) for key, item in data.items()}
+    return data
+
+def fill(data, values):
+    """Inverse of abstract: slot marker i becomes values[i]."""
+    if isinstance(data, str):
+        return values[int(data[1:])] if data.startswith("\0") else data
+    if isinstance(data, list):
+        return [fill(item, values) for item in data]
+    if isinstance(data, dict):
+        return {key: fill(item, values) for key, item in data.items()}
+    return data
+
+class TemplateMatcher:
+    """Pipeline results for known question shapes, filled in without tokenizing or parsing.
+
+    Shapes come from the golden questions: every city, airline and plane they mention is replaced
+    by each entity of its kind in turn, and each such question is run through the full pipeline
+    once. Results are stored by normalized text in which times that the golden-tree bank has no
+    arc for become slots; a question with slots is run with two sets of probe times and kept only
+    when both give the same result up to those times, so that any other times can be filled in.
+    A question whose normalized text has no template is left to the full pipeline.
+    """
+
+    def __init__(self, parser, run, encode, decode, path=TEMPLATE_FILE, limit=4096):
+        self.parser = parser
+        self.run = run
+        self.encode = encode
+        self.decode = decode
+        self.path = path
+        # Most questions compiled per golden question, bounding the entity combinations tried
+        self.limit = limit
+        # Template key -> JSON-ready result with slot markers, or None when its times cannot be slots
+        self.templates = None
+        self.hits = 0
+        self.misses = 0
+
+    def shape(self, normalized):
+        """Template key of a normalized question and the times that fill its slots."""
+        times = []
+
+        def slot(match):
+            if self.parser.in_bank(match.group()):
+                return match.group()
+            times.append(match.group())
+            return "\0"
+
+        return TIME_SLOT.sub(slot, normalized), times
+
+    def questions(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return list(dict.fromkeys(line.strip() for line in f if line.strip()))
+        except FileNotFoundError:
+            print(f"Warning: Template file {self.path} not found. Fast path disabled.")
+            return []
+
+    def compile(self):
+        """Run every filled-in golden question through the full pipeline and store its template."""
+        lexicon = self.parser.lexicon
+        bank_times = sorted({token for token in (*self.parser.bank_head_count, *self.parser.bank_by_dep)
+                             if TIME_SLOT.fullmatch(token)})
+        self.templates = {}
+        for question in self.questions():
+            text = lexicon.normalize(" ".join(question.split()))
+            mentions = lexicon.gazetteer.find(text)
+            pools = [lexicon.names(entity.kind) for _, _, entity in mentions]
+            compiled = 0
+            for names in product(*pools):
+                parts, last = [], 0
+                for (start, end, _), name in zip(mentions, names):
+                    parts += [text[last:start], name]
+                    last = end
+                normalized = self.parser.normalize("".join(parts) + text[last:])
+                # Each time is tried as every bank time, which stays in the key, and as a slot
+                times = list(TIME_SLOT.finditer(normalized))
+                for choice in islice(product(*[bank_times + [None]] * len(times)), self.limit - compiled):
+                    compiled += 1
+                    self.add(normalized, times, choice)
+                if compiled >= self.limit:
+                    break
+
+    def add(self, normalized, times, choice):
+        slots = [i for i, value in enumerate(choice) if value is None]
+        variants = []
+        for probe in range(2 if slots else 1):
+            values = list(choice)
+            for n, i in enumerate(slots):
+                values[i] = probes(n)[probe]
+            parts, last = [], 0
+            for match, value in zip(times, values):
+                parts += [normalized[last:match.start()], value]
+                last = match.end()
+            question = "".join(parts) + normalized[last:]
+            if probe == 0:
+                key = self.shape(question)[0]
+                if key in self.templates:
+                    return
+            variants.append(abstract(self.encode(self.run(question)), [probes(n)[probe] for n in range(len(slots))]))
+        self.templates[key] = variants[0] if all(variant == variants[0] for variant in variants) else None
+
+    def match(self, normalized):
+        """Pipeline result for a normalized question from its template, or None on a miss."""
+        if self.templates is None:
+            self.compile()
+        key, times = self.shape(normalized)
+        template = self.templates.get(key)
+        # Equal times would be merged by tokenization, unlike the distinct probes of the template
+        if template is None or len(set(times)) != len(times):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.decode(fill(template, times))
+
+    def reject(self, normalized):
+        """Stop answering a question's shape from its template, e.g. after it disagreed with the pipeline."""
+        self.templates[self.shape(normalized)[0]] = None
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "templates": sum(template is not None for template in (self.templates or {}).values())}
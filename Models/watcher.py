@@ -0,0 +1,92 @@
+import os
+import threading
+from collections import Counter
+
+class DatabaseWatcher:
+    """Poll a database file and apply only its changed lines to a FlightDatabase.
+
+    Lines are compared as a multiset with the last seen content, so edits, appends and deletions
+    anywhere in the file become one batch of retractions and appends (one new database version).
+
+    A rewrite in place (truncate, then write) must not look like every fact being retracted, so a
+    change is only applied once the file's mtime and size have held still for a whole poll, did
+    not move while it was read, and every fact line in it parses. Replacing the file with an
+    atomic rename is still the safe way to publish a new version; it is picked up one poll later.
+    """
+
+    def __init__(self, db, path, interval=1.0, on_change=None):
+        self.db = db
+        self.path = path
+        self.interval = interval
+        self.on_change = on_change
+        self.lines = self.read()
+        self.stat = self.signature()
+        # Signature of a change seen at the last poll and not applied yet, waiting to hold still
+        self.pending = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def read(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            return Counter(line.strip() for line in f if line.strip())
+
+    def signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self):
+        """Apply the lines changed since the last check; returns the new version, or None if nothing changed."""
+        stat = self.signature()
+        if stat is None or stat == self.stat:
+            self.pending = None
+            return None
+        if stat != self.pending:
+            # Still being written, or changed since the last poll: wait for it to hold still
+            self.pending = stat
+            return None
+        lines = self.read()
+        if self.signature() != stat:
+            self.pending = None
+            return None
+        new = list((lines - self.lines).elements())
+        added = [self.db.parse_fact(line) for line in new]
+        if any(fact is None and line.startswith("(") for line, fact in zip(new, added)):
+            # A fact cut short, e.g. by a writer that has not finished; the next poll reads it again
+            return None
+        retracted = [self.db.parse_fact(line) for line in (self.lines - lines).elements()]
+        added = [fact for fact in added if fact]
+        retracted = [fact for fact in retracted if fact]
+        version = self.db.apply(added, retracted) if added or retracted else None
+        # Only an applied change is remembered, so a failed one is tried again on the next poll
+        self.stat = stat
+        self.lines = lines
+        self.pending = None
+        if version is None:
+            return None
+        if self.on_change:
+            self.on_change(version, added, retracted)
+        return version
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.check()
+            except (OSError, UnicodeDecodeError):
+                # The file may be mid-write; the next poll sees it complete
+                self.stat = None
+            except Exception as error:
+                # Keep polling: the change is retried and later edits still apply
+                print(f"Warning: Could not apply changes to {self.path}: {error!r}")
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="database-watcher", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
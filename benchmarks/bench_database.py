@@ -0,0 +1,51 @@
+"""Compare indexed FlightDatabase lookups with full scans as the schedule grows."""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Models.database import FlightDatabase
+from benchmarks.synthetic import write_database
+
+SCALES = [10, 1000, 10000, 100000]
+PROCEDURES = [
+    ["PRINT-ALL", "?m1", "(MÁY_BAY ?m1)", "(ATIME ?m1 HUE ?time)"],
+    ["PRINT-ALL", "?m1", "(MÁY_BAY ?m1)", "(DTIME ?m1 HCMC ?time)"],
+    ["PRINT-ALL", "?m1", "(MÁY_BAY ?m1)", "(RUN-TIME ?m1 HCMC HN ?time)"],
+    ["PRINT-ALL", "?m1", "(MÁY_BAY ?m1)", "(RUN-TIME ?m1 ĐN HCMC 1:00HR)"],
+    ["PRINT-ALL", "?m1", "?dtime", "?atime", "(DTIME ?m1 HCMC ?dtime)", "(ATIME ?m1 HN ?atime)"],
+]
+
+def scan(db, pred, **bound):
+    """Reference lookup by scanning every row, as FlightDatabase.query used to."""
+    columns = db.COLUMNS[pred]
+    return [row for row in db.data[pred] if all(row[columns.index(c)] == v for c, v in bound.items())]
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'flights':>8} {'load s':>8} {'scan ms':>9} {'index ms':>9} {'query ms':>9}")
+        for n in SCALES:
+            path = write_database(os.path.join(tmp, f"db_{n}.txt"), n)
+            start = time.perf_counter()
+            db = FlightDatabase(path)
+            load = time.perf_counter() - start
+            lookups = [("ATIME", {"city": "HUE"}), ("DTIME", {"city": "HCMC", "time": "9:00HR"}),
+                       ("RUN-TIME", {"source": "HCMC", "dest": "HN"})]
+            for pred, bound in lookups:
+                assert db.lookup(pred, **bound) == scan(db, pred, **bound)
+            repeat = max(1, 10000 // n)
+            scan_ms = timed(lambda: [scan(db, p, **b) for p, b in lookups], repeat) * 1000
+            index_ms = timed(lambda: [db.lookup(p, **b) for p, b in lookups], repeat) * 1000
+            query_ms = timed(lambda: [db.query(p) for p in PROCEDURES], repeat) * 1000
+            print(f"{n:>8} {load:>8.3f} {scan_ms:>9.3f} {index_ms:>9.3f} {query_ms:>9.3f}")
+
+if __name__ == "__main__":
+    main()
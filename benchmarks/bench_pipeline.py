@@ -0,0 +1,66 @@
+"""Per-stage timing of QueryProcessor.process over the sample questions."""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from Models.processor import QueryProcessor
+from Models.database import FlightDatabase
+
+def run_stages(processor, db, query, totals):
+    """Run each pipeline stage separately, adding its wall time to totals."""
+    def timed(name, fn, *args):
+        start = time.perf_counter()
+        value = fn(*args)
+        totals[name] = totals.get(name, 0.0) + time.perf_counter() - start
+        return value
+
+    parser = processor.parser
+    tokens = timed("tokenize", parser.tokenize, query)
+    dependencies = timed("get_dependencies", parser.get_dependencies, query, tokens)
+    grammatical = timed("dependencies_to_grammatical", processor.dependencies_to_grammatical, dependencies, query)
+    logical = timed("grammatical_to_logical", processor.grammatical_to_logical, grammatical)
+    procedural = timed("logical_to_procedural", processor.logical_to_procedural, logical, query)
+    timed("query", db.query, procedural)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", default="input/query.txt")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    processor = QueryProcessor()
+    db = FlightDatabase("input/database.txt")
+    with open(args.queries, encoding="utf-8") as f:
+        queries = [line.strip() for line in f if line.strip()]
+    processor.process(queries[0])  # load the underthesea model outside the measurement
+
+    totals = {}
+    for _ in range(args.repeat):
+        for query in queries:
+            run_stages(processor, db, query, totals)
+    n = args.repeat * len(queries)
+
+    print(f"{'stage':<30} {'ms/query':>10} {'share':>7}")
+    total = sum(totals.values())
+    for name, seconds in totals.items():
+        print(f"{name:<30} {seconds / n * 1000:>10.3f} {seconds / total:>7.1%}")
+    print(f"{'total (tokenize once)':<30} {total / n * 1000:>10.3f}")
+    # get_dependencies used to tokenize the sentence again on its own
+    print(f"{'total (tokenize twice)':<30} {(total + totals['tokenize']) / n * 1000:>10.3f}")
+
+    # Known question shapes filled in from templates, without any of the parsing stages
+    fast = QueryProcessor(cache_size=0, fast_path="on")
+    fast.warm_up()
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for query in queries:
+            fast.process(query)
+    print(f"{'template fast path (no query)':<30} {(time.perf_counter() - start) / n * 1000:>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Measure cold import and time to first answer, each in a fresh interpreter."""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    "import underthesea": """
+import underthesea
+""",
+    "database only": """
+from Models.database import FlightDatabase
+db = FlightDatabase("input/database.txt")
+db.query(["PRINT-ALL", "?m1", "(MÁY_BAY ?m1)", "(ATIME ?m1 HUE ?time)"])
+""",
+    "construct QueryProcessor": """
+from Models.processor import QueryProcessor
+QueryProcessor()
+""",
+    "warm_up": """
+from Models.processor import QueryProcessor
+QueryProcessor().warm_up()
+""",
+    "first answer": """
+from Models.processor import QueryProcessor
+from Models.database import FlightDatabase
+processor = QueryProcessor()
+db = FlightDatabase("input/database.txt")
+db.query(processor.process("Máy bay nào hạ cánh ở Huế ?")["procedural"])
+""",
+}
+
+TIMER = """
+import json, time
+start = time.perf_counter()
+{body}
+print(json.dumps(time.perf_counter() - start))
+"""
+
+def run(body):
+    out = subprocess.run([sys.executable, "-c", TIMER.format(body=body)], cwd=ROOT,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def main(repeat=3):
+    print(f"{'scenario':<26} {'best s':>8}")
+    for name, body in SCENARIOS.items():
+        best = min(run(body) for _ in range(repeat))
+        print(f"{name:<26} {best:>8.3f}")
+
+if __name__ == "__main__":
+    main()
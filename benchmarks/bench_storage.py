@@ -0,0 +1,74 @@
+"""Compare memory and lookup time of columnar FlightDatabase storage with the old row lists."""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Models.database import FlightDatabase
+from benchmarks.synthetic import write_database
+
+SCALES = [1000, 10000, 100000]
+
+class RowStore:
+    """The previous layout: a list of string tuples per predicate and dict-of-list indexes of row ids."""
+
+    def __init__(self, db_file):
+        self.data = {pred: [] for pred in FlightDatabase.COLUMNS}
+        self.index = {pred: {column: {} for column in columns} for pred, columns in FlightDatabase.COLUMNS.items()}
+        with open(db_file, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.strip()[1:-1].split()
+                if not parts:
+                    continue
+                pred, row = parts[0], tuple(parts[1:])
+                if pred == "MÁY_BAY":
+                    row = (row[0], FlightDatabase.airline(row[0]))
+                row_id = len(self.data[pred])
+                self.data[pred].append(row)
+                for column, value in zip(FlightDatabase.COLUMNS[pred], row):
+                    self.index[pred][column].setdefault(value, []).append(row_id)
+
+    def lookup(self, pred, **bound):
+        columns = FlightDatabase.COLUMNS[pred]
+        rows = self.data[pred]
+        column = min(bound, key=lambda c: len(self.index[pred][c].get(bound[c], ())))
+        rest = [(columns.index(c), v) for c, v in bound.items() if c != column]
+        return [rows[i] for i in self.index[pred][column].get(bound[column], ())
+                if all(rows[i][p] == v for p, v in rest)]
+
+def measure(factory, path):
+    """Build a store under tracemalloc, returning (store, bytes still allocated)."""
+    tracemalloc.start()
+    store = factory(path)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return store, size
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+def main():
+    lookups = [("ATIME", {"city": "HUE"}), ("DTIME", {"city": "HCMC", "time": "9:00HR"}),
+               ("RUN-TIME", {"source": "HCMC", "dest": "HN"})]
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'flights':>8} {'rows B/row':>11} {'cols B/row':>11} {'rows ms':>8} {'cols ms':>8}")
+        for n in SCALES:
+            path = write_database(os.path.join(tmp, f"db_{n}.txt"), n)
+            rows, row_bytes = measure(RowStore, path)
+            cols, col_bytes = measure(FlightDatabase, path)
+            facts = sum(len(table) for table in cols.data.values())
+            for pred, bound in lookups:
+                assert rows.lookup(pred, **bound) == cols.lookup(pred, **bound)
+            repeat = max(1, 100000 // n)
+            row_ms = sum(timed(lambda: rows.lookup(p, **b), repeat) for p, b in lookups) * 1000
+            col_ms = sum(timed(lambda: cols.lookup(p, **b), repeat) for p, b in lookups) * 1000
+            print(f"{n:>8} {row_bytes / facts:>11.1f} {col_bytes / facts:>11.1f} {row_ms:>8.3f} {col_ms:>8.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Benchmark the pipeline stages, the database and end-to-end answering on synthetic workloads.
+
+Results are saved as JSON under benchmarks/results/ and can be compared with an earlier run:
+
+    python benchmarks/harness.py --scales 10 1000 100000 --questions 2000 --save
+    python benchmarks/harness.py --compare benchmarks/results/<earlier>.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from Models.database import FlightDatabase
+from Models.metrics import METRICS, Histogram
+from Models.processor import QueryProcessor
+from benchmarks.questions import generate_questions
+from benchmarks.synthetic import write_database
+
+SCALES = [10, 1000, 10000, 100000]
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+FLOOR = 50e-6
+
+def latency(samples):
+    """Summary of a list of per-call seconds, with throughput in calls per second."""
+    histogram = Histogram()
+    for seconds in samples:
+        histogram.observe(seconds)
+    summary = histogram.summary()
+    summary["per_second"] = len(samples) / summary["sum"] if summary["sum"] else 0.0
+    return summary
+
+def bench_pipeline(processor, questions):
+    """Per-stage latency of the uncached NLP pipeline, read from the stage timers."""
+    METRICS.reset()
+    METRICS.enable()
+    try:
+        results = [processor.process(question) for question in questions]
+    finally:
+        METRICS.disable()
+    stages = {name: h.summary() for name, h in METRICS.histograms.items()}
+    stages["process"]["per_second"] = stages["process"]["count"] / stages["process"]["sum"]
+    valid = sum(1 for result in results if result["procedural"].command in ("PRINT-ALL", "VERIFY"))
+    return stages, [result["procedural"] for result in results], valid / len(results)
+
+def bench_scale(n, tmp, processor, questions, procedures):
+    """Load, query and end-to-end numbers for one synthetic database of n flights."""
+    path = write_database(os.path.join(tmp, f"db_{n}.txt"), n)
+    start = time.perf_counter()
+    db = FlightDatabase(path, answer_cache_size=0)
+    load = time.perf_counter() - start
+
+    snapshot = os.path.join(tmp, f"db_{n}.snap")
+    db.save_snapshot(snapshot)
+    start = time.perf_counter()
+    FlightDatabase(path, snapshot=snapshot, answer_cache_size=0)
+    open_snapshot = time.perf_counter() - start
+
+    samples = []
+    for procedure in procedures:
+        start = time.perf_counter()
+        db.query(procedure)
+        samples.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    db.query_many(procedures)
+    batch = time.perf_counter() - start
+
+    end_to_end = []
+    for question in questions:
+        start = time.perf_counter()
+        db.query(processor.process(question)["procedural"])
+        end_to_end.append(time.perf_counter() - start)
+    return {"flights": n, "load_s": load, "snapshot_open_s": open_snapshot,
+            "query": latency(samples), "batch_per_second": len(procedures) / batch, "end_to_end": latency(end_to_end)}
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current, baseline, tolerance):
+    """Print per-metric ratios against a baseline run; returns the regressions beyond tolerance."""
+    rows = [("pipeline " + name, stage["p50"], baseline["pipeline"].get(name, {}).get("p50"))
+            for name, stage in current["pipeline"].items()]
+    old_scales = {scale["flights"]: scale for scale in baseline["scales"]}
+    for scale in current["scales"]:
+        old = old_scales.get(scale["flights"])
+        if old:
+            rows.append((f"{scale['flights']} load_s", scale["load_s"], old["load_s"]))
+            rows.append((f"{scale['flights']} query p50", scale["query"]["p50"], old["query"]["p50"]))
+            rows.append((f"{scale['flights']} query p99", scale["query"]["p99"], old["query"]["p99"]))
+            rows.append((f"{scale['flights']} end_to_end p50", scale["end_to_end"]["p50"], old["end_to_end"]["p50"]))
+    regressions = []
+    print(f"{'metric':<40} {'baseline ms':>12} {'current ms':>12} {'ratio':>7}")
+    for name, new, old in rows:
+        # Below FLOOR a single histogram bucket (a factor 2^(1/4)) is already a large ratio
+        if not old or old < FLOOR:
+            continue
+        ratio = new / old
+        flag = " !" if ratio > 1 + tolerance else ""
+        print(f"{name:<40} {old * 1000:>12.3f} {new * 1000:>12.3f} {ratio:>7.2f}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def report(result):
+    print(f"{'stage':<30} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, stage in result["pipeline"].items():
+        print(f"{name:<30} {stage['p50'] * 1000:>9.3f} {stage['p95'] * 1000:>9.3f} {stage['p99'] * 1000:>9.3f}")
+    print(f"questions parsed to a valid procedure: {result['valid_share']:.1%}")
+    print(f"{'flights':>8} {'load s':>8} {'open s':>8} {'query p50':>10} {'query p99':>10} {'q/s':>9} {'batch q/s':>10} {'e2e q/s':>9}")
+    for scale in result["scales"]:
+        print(f"{scale['flights']:>8} {scale['load_s']:>8.3f} {scale['snapshot_open_s']:>8.3f} "
+              f"{scale['query']['p50'] * 1000:>10.3f} {scale['query']['p99'] * 1000:>10.3f} "
+              f"{scale['query']['per_second']:>9.0f} {scale['batch_per_second']:>10.0f} {scale['end_to_end']['per_second']:>9.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES, help="flights per synthetic database, up to 1000000")
+    parser.add_argument("--questions", type=int, default=1000, help="generated questions per run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", nargs="?", const="", default=None, help="save results as JSON (default: benchmarks/results/<time>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="slowdown ratio above 1 reported as a regression")
+    args = parser.parse_args()
+
+    questions = generate_questions(args.questions, args.seed)
+    # The parse cache is off so that every question runs the full pipeline
+    processor = QueryProcessor(cache_size=0)
+    processor.warm_up()
+    pipeline, procedures, valid = bench_pipeline(processor, questions)
+    result = {"revision": git_revision(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": platform.python_version(), "machine": platform.machine(),
+              "questions": args.questions, "seed": args.seed, "valid_share": valid, "pipeline": pipeline, "scales": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.scales:
+            result["scales"].append(bench_scale(n, tmp, processor, questions, procedures))
+    report(result)
+
+    if args.save is not None:
+        path = args.save or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"saved {path}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import random
+from benchmarks.synthetic import format_time
+
+# Spellings of each synthetic city code that the parser's normalization and city list understand
+CITY_NAMES = {
+    "HUE": ["Huế"],
+    "HCMC": ["Hồ Chí Minh", "TP. Hồ Chí Minh", "TP.HCM", "HCMC", "Tp.Hồ Chí Minh"],
+    "ĐN": ["Đà Nẵng"],
+    "HN": ["Hà Nội", "TP. Hà Nội"],
+    "KH": ["Khánh Hòa"],
+    "HP": ["Hải Phòng"],
+}
+# Planes the golden-tree bank and the lexicon recognise
+PLANES = ["VN1", "VN2", "VN3", "VN4", "VN5", "VJ1", "VJ2", "VJ3", "VJ4", "VJ5"]
+
+# Question shapes from input/query.txt with their entities replaced by slots
+TEMPLATES = [
+    "Máy bay nào đến thành phố {dest} lúc {time} ?",
+    "Máy bay nào bay từ {source} đến {dest} mất {hours} giờ ?",
+    "Hãy cho biết mã hiệu các máy bay hạ cánh ở {dest} ?",
+    "Máy bay nào xuất phát từ {source}, lúc mấy giờ ?",
+    "Máy bay nào bay từ {source} đến {dest} ?",
+    "Máy bay {plane} có xuất phát từ {source} không ?",
+    "Thời gian máy bay {plane} bay từ {source} đến {dest} mất mấy giờ ?",
+    "Có máy bay nào xuất phát từ {source} không ?",
+    "Máy bay của hãng hàng không VietJet Air bay đến những thành phố nào ?",
+    "Có máy bay nào bay từ {source} đến {dest} không ?",
+    "Máy bay {plane} xuất phát từ {source} {time} phải không ?",
+    "Máy bay nào bay từ {source} đến {dest} mất {duration} ?",
+    "Máy bay nào của VNAirline bay từ {source} ra {dest} mất {hours} giờ ?",
+    "Máy bay {plane} có xuất phát từ {source} không, lúc mấy giờ ?",
+    "Máy bay nào hạ cánh ở {dest} ?",
+    "Máy bay nào cất cánh từ {source} ?",
+    "Có máy bay nào bay từ {source} ra {dest} không, nếu có thì thời gian bay là bao lâu ?",
+    "Có mấy máy bay bay đến {dest}, kể tên máy bay !",
+]
+
+def generate_questions(n, seed=0, cities=None):
+    """Generate n questions by filling TEMPLATES with random cities, planes and times."""
+    rng = random.Random(seed)
+    codes = [code for code in (cities or CITY_NAMES) if code in CITY_NAMES]
+    questions = []
+    for _ in range(n):
+        source, dest = rng.sample(codes, 2)
+        hours = rng.choice([1, 2])
+        questions.append(rng.choice(TEMPLATES).format(
+            source=rng.choice(CITY_NAMES[source]),
+            dest=rng.choice(CITY_NAMES[dest]),
+            plane=rng.choice(PLANES),
+            time=format_time(rng.randrange(0, 20 * 60, 30)),
+            hours=hours,
+            duration=format_time(hours * 60),
+        ))
+    return questions
+
+def write_questions(path, n, seed=0):
+    """Write generated questions one per line, like input/query.txt."""
+    with open(path, "w", encoding="utf-8") as f:
+        for question in generate_questions(n, seed):
+            f.write(question + "\n")
+    return path
@@ -0,0 +1,31 @@
+import random
+
+AIRLINES = ["VN", "VJ", "QH", "BL"]
+CITIES = ["HUE", "HCMC", "ĐN", "HN", "KH", "HP"]
+
+def format_time(minutes):
+    """Render minutes since midnight in the database time format, e.g. 13:30HR."""
+    return f"{minutes // 60}:{minutes % 60:02d}HR"
+
+def generate_facts(n_flights, seed=0, cities=None):
+    """Generate MÁY_BAY/DTIME/ATIME/RUN-TIME facts for n_flights synthetic flights."""
+    rng = random.Random(seed)
+    cities = cities or CITIES
+    facts = []
+    for i in range(1, n_flights + 1):
+        plane = f"{AIRLINES[i % len(AIRLINES)]}{i}"
+        source, dest = rng.sample(cities, 2)
+        depart = rng.randrange(0, 20 * 60, 15)
+        duration = rng.choice([60, 90, 120, 150])
+        facts.append(f"(MÁY_BAY {plane})")
+        facts.append(f"(DTIME {plane} {source} {format_time(depart)})")
+        facts.append(f"(ATIME {plane} {dest} {format_time(depart + duration)})")
+        facts.append(f"(RUN-TIME {plane} {source} {dest} {format_time(duration)})")
+    return facts
+
+def write_database(path, n_flights, seed=0, cities=None):
+    """Write a synthetic database file in the same s-expression format as input/database.txt."""
+    with open(path, "w", encoding="utf-8") as f:
+        for fact in generate_facts(n_flights, seed, cities):
+            f.write(fact + "\n")
+    return path
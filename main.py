@@ -1,51 +1,170 @@
+import argparse
+import asyncio
 import os
-from Models.processor import QueryProcessor
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from Models.logical import format_logical
+from Models.parser import format_arcs
+from Models.plan import QueryPlan, format_procedure
+from Models.processor import QueryProcessor, init_worker, process_query
 from Models.database import FlightDatabase
+from Models.metrics import METRICS
+from Models.output import FORMATS, open_writer, result_record
+from Models.server import QueryServer
+from Models.watcher import DatabaseWatcher
 
-def write_output(filename, data):
-    """Write data to output file, converting lists to strings."""
-    with open(os.path.join("Output", filename), "a", encoding="utf-8") as f:
-        if isinstance(data, list):
-            if filename == "logical.txt":
-                data_str = "".join(data)
-            elif filename == "procedural.txt":
-                if data[0] == "PRINT-ALL" and len(data) >= 2:
-                    data_str = f"(PRINT-ALL {data[1]} {' '.join(data[2:])})"
-                elif data[0] == "VERIFY" and len(data) >= 1:
-                    data_str = f"(VERIFY {' '.join(data[1:])})"
-                else:
-                    data_str = str(data)
-            elif filename == "answers.txt":
-                if isinstance(data, list) and len(data) == 1 and not isinstance(data[0], tuple):
-                    data_str = str(data[0])
-                else:
-                    data_str = str(data)
-            else:
-                data_str = str(data)
-        else:
-            data_str = str(data)
-        f.write(data_str + "\n")
+OUTPUT_FILES = ["tokens.txt", "dependencies.txt", "grammatical.txt", "logical.txt", "procedural.txt", "answers.txt"]
+
+def format_output(filename, data):
+    """Render data as one output line, converting lists and logical/procedural forms to strings."""
+    if isinstance(data, QueryPlan):
+        data = format_procedure(data)
+    if isinstance(data, list):
+        if filename == "logical.txt":
+            return "".join(format_logical(data))
+        elif filename == "procedural.txt":
+            if data[0] == "PRINT-ALL" and len(data) >= 2:
+                return f"(PRINT-ALL {data[1]} {' '.join(data[2:])})"
+            elif data[0] == "VERIFY" and len(data) >= 1:
+                return f"(VERIFY {' '.join(data[1:])})"
+            return str(data)
+        elif filename == "dependencies.txt":
+            return str(format_arcs(data))
+        elif filename == "answers.txt":
+            if len(data) == 1 and not isinstance(data[0], tuple):
+                return str(data[0])
+            return str(data)
+        return str(data)
+    return str(data)
+
+def write_result(writer, query, result, answer):
+    """Write one processed query and its answer through an output writer, as a single record:
+    structured values for a jsonl or binary stream, the lines of the text files otherwise."""
+    if writer.structured:
+        writer.write_record(result_record(query, result, answer))
+        return
+    writer.write_record({
+        "tokens.txt": format_output("tokens.txt", result["tokens"]),
+        "dependencies.txt": format_output("dependencies.txt", result["dependencies"]),
+        "grammatical.txt": format_output("grammatical.txt", result["grammatical"]),
+        "logical.txt": format_output("logical.txt", result["logical"]),
+        "procedural.txt": format_output("procedural.txt", result["procedural"]),
+        "answers.txt": f"{answer}",
+    })
+
+def read_queries(path):
+    """Stream non-empty query lines from a file, or from stdin when path is '-'."""
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def run_batch(queries, db, output_dir="Output", workers=None, chunksize=64, cache_path=None,
+              database="input/database.txt", lexicon="input/lexicon.txt", fast_path=None,
+              output_format="text", flush_interval=1.0):
+    """Process a stream of queries over a process pool, writing results in input order."""
+    workers = workers or os.cpu_count() or 1
+    with open_writer(output_dir, OUTPUT_FILES, output_format, flush_interval=flush_interval) as writer:
+        if workers == 1:
+            init_worker(cache_path, database, lexicon, fast_path)
+            for query in queries:
+                result = process_query(query)
+                write_result(writer, query, result, db.query(result["procedural"]))
+            return
+        # Submit bounded windows so huge inputs are never read into memory at once
+        window = workers * chunksize * 4
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(cache_path, database, lexicon, fast_path)) as pool:
+            while True:
+                batch = list(islice(queries, window))
+                if not batch:
+                    break
+                results = list(pool.map(process_query, batch, chunksize=chunksize))
+                # One database pass per window shares the filters common to its questions
+                answers = db.query_many([result["procedural"] for result in results])
+                for query, result, answer in zip(batch, results, answers):
+                    write_result(writer, query, result, answer)
+
+def report_change(version, added, retracted):
+    print(f"Database version {version}: +{len(added)} -{len(retracted)} facts")
 
 def main():
-    os.makedirs("Output", exist_ok=True)
-    for file in ["tokens.txt", "dependencies.txt", "grammatical.txt", "logical.txt", "procedural.txt", "answers.txt"]:
-        open(os.path.join("Output", file), "w", encoding="utf-8").close()
-
-    processor = QueryProcessor()
-    db = FlightDatabase("Input/database.txt")
-
-    with open("Input/query.txt", "r", encoding="utf-8") as f:
-        queries = [line.strip() for line in f if line.strip()]
-
-    for query in queries:
-        result = processor.process(query)
-        write_output("tokens.txt", result["tokens"])
-        write_output("dependencies.txt", result["dependencies"])
-        write_output("grammatical.txt", result["grammatical"])
-        write_output("logical.txt", result["logical"])
-        write_output("procedural.txt", result["procedural"])
-        answer = db.query(result["procedural"])
-        write_output("answers.txt", f"{answer}")
+    parser = argparse.ArgumentParser(description="Vietnamese flight question answering pipeline.")
+    parser.add_argument("--queries", default="input/query.txt", help="query file, or - to read from stdin")
+    parser.add_argument("--database", default="input/database.txt")
+    parser.add_argument("--lexicon", default="input/lexicon.txt", help="city, airline and plane names and aliases, one entity per line")
+    parser.add_argument("--snapshot", default=None, help="binary database snapshot to map, rebuilt when --database is newer")
+    parser.add_argument("--compile", action="store_true", help="compile --database into a snapshot (--snapshot or <database>.snap) and exit")
+    parser.add_argument("--output", default="Output")
+    parser.add_argument("--format", choices=FORMATS, default="text",
+                        help="text: one file per stage; jsonl or binary: one record per question in a single results.jsonl or results.bin")
+    parser.add_argument("--flush-interval", type=float, default=1.0, help="seconds buffered output may wait before it is written to disk")
+    parser.add_argument("--batch", action="store_true", help="stream queries through a process pool with buffered output")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for --batch (default: CPU count) or --serve (default: none)")
+    parser.add_argument("--chunksize", type=int, default=64, help="queries sent to a worker at a time in --batch")
+    parser.add_argument("--cache", default=None, help="sqlite file that keeps parse results across runs")
+    parser.add_argument("--fast-path", choices=["on", "verify"], default=None,
+                        help="fill in known question shapes from templates instead of parsing; verify also runs the full pipeline and warns on differences")
+    parser.add_argument("--answer-cache", type=int, default=1024, help="answers kept by procedural form")
+    parser.add_argument("--answer-ttl", type=float, default=None, help="seconds a cached answer stays valid (default: until the data changes)")
+    parser.add_argument("--metrics", default=None, help="collect stage timings and counters, written to this file on exit (.prom for Prometheus text, else JSON); "
+                        "with several --workers, parser stages are timed inside the workers and not included")
+    parser.add_argument("--profile", default=None, help="run under cProfile and save the stats to this file")
+    parser.add_argument("--serve", action="store_true", help="answer questions over HTTP with the pipeline kept loaded")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--watch", type=float, default=None, metavar="SECONDS",
+                        help="with --serve, poll --database every SECONDS and apply changed facts without restarting")
+    args = parser.parse_args()
+    if args.metrics or args.profile:
+        METRICS.enable(profile=bool(args.profile))
+    try:
+        run(args)
+    finally:
+        if args.metrics:
+            METRICS.export(args.metrics)
+        if args.profile:
+            METRICS.dump_profile(args.profile)
+
+def run(args):
+    """Run the mode selected on the command line."""
+    if args.compile:
+        FlightDatabase(args.database).save_snapshot(args.snapshot or os.path.splitext(args.database)[0] + ".snap")
+        return
+    db = FlightDatabase(args.database, snapshot=args.snapshot, answer_cache_size=args.answer_cache, answer_ttl=args.answer_ttl)
+    if args.serve:
+        server = QueryServer(db, workers=args.workers or 0, cache_path=args.cache,
+                             database=args.database, lexicon=args.lexicon, fast_path=args.fast_path)
+        watcher = DatabaseWatcher(db, args.database, args.watch, report_change).start() if args.watch else None
+        try:
+            asyncio.run(server.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if watcher:
+                watcher.stop()
+            server.close()
+        return
+    if args.batch:
+        run_batch(read_queries(args.queries), db, args.output, args.workers, args.chunksize, args.cache,
+                  args.database, args.lexicon, args.fast_path, args.format, args.flush_interval)
+        return
+
+    processor = QueryProcessor(cache_path=args.cache, database=args.database, lexicon=args.lexicon, fast_path=args.fast_path)
+
+    # Lines are written by a background thread, so parsing never waits on the disk
+    try:
+        with open_writer(args.output, OUTPUT_FILES, args.format, flush_interval=args.flush_interval) as writer:
+            for query in read_queries(args.queries):
+                result = processor.process(query)
+                write_result(writer, query, result, db.query(result["procedural"]))
+    finally:
+        processor.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
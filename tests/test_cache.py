@@ -0,0 +1,42 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Models.cache import ParseCache
+
+class ParseCacheTest(unittest.TestCase):
+    RESULT = {"tokens": ["máy bay", "nào"], "dependencies": [["root", "ROOT", "nào"]]}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "parses.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_hit_is_a_copy(self):
+        cache = ParseCache("v1")
+        cache.put("q", self.RESULT)
+        first = cache.get("q")
+        first["tokens"].append("?")
+        second = cache.get("q")
+        self.assertIsNot(first, second)
+        self.assertEqual(second, self.RESULT)
+
+    def test_batched_commits_survive_close(self):
+        cache = ParseCache("v1", path=self.path, commit_size=100, commit_interval=3600)
+        for i in range(10):
+            cache.put(f"q{i}", self.RESULT)
+        self.assertEqual(cache.pending, 10)
+        cache.close()
+        reopened = ParseCache("v1", maxsize=0, path=self.path)
+        self.assertEqual([reopened.get(f"q{i}") for i in range(10)], [self.RESULT] * 10)
+        reopened.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Models.database import FlightDatabase
+
+class ConcurrentApplyTest(unittest.TestCase):
+    """Queries running while apply() changes the tables must see a consistent version and never fail."""
+
+    def setUp(self):
+        # Switch threads as often as possible so that readers land inside apply()
+        self.interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "database.txt")
+        shutil.copy(os.path.join(ROOT, "input", "database.txt"), self.path)
+
+    def tearDown(self):
+        sys.setswitchinterval(self.interval)
+        shutil.rmtree(self.directory)
+
+    def test_query_during_apply(self):
+        db = FlightDatabase(self.path, answer_cache_size=0)
+        expected = db.query(["PRINT-ALL", "?m", "(ATIME ?m HUE ?t)"])
+        stop = threading.Event()
+        errors = []
+
+        def write():
+            n = 0
+            while not stop.is_set():
+                facts = [fact for k in range(50) for fact in
+                         (("ATIME", (f"VX{n}-{k}", "HUE", "9:00HR")), ("MÁY_BAY", f"VX{n}-{k}"))]
+                db.apply(added=facts)
+                db.apply(retracted=facts)
+                n += 1
+
+        def read():
+            while not stop.is_set():
+                try:
+                    answer = db.query(["PRINT-ALL", "?m", "(ATIME ?m HUE ?t)"])
+                    # Every version the reader can pin has either both facts of a batch or neither
+                    if answer != expected and not (isinstance(answer, list) and len(answer) == len(expected) + 50):
+                        errors.append(answer)
+                except Exception as error:
+                    errors.append(error)
+                    return
+
+        threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        time.sleep(2)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(db.query(["PRINT-ALL", "?m", "(ATIME ?m HUE ?t)"]), expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Models.database import FlightDatabase
+
+class AirlineLookupTest(unittest.TestCase):
+    """An airline given by one of its plane codes matches every plane of that airline."""
+
+    def setUp(self):
+        self.db = FlightDatabase(os.path.join(ROOT, "input", "database.txt"))
+
+    def test_plane_code_as_airline(self):
+        expected = self.db.query(["PRINT-ALL", "?m1", "(MÁY_BAY ?m1 VJ)"])
+        self.assertTrue(expected and all(plane.startswith("VJ") for plane in expected))
+        query = ["PRINT-ALL", "?m1", "(MÁY_BAY ?m1 VJ1)"]
+        self.assertEqual(self.db.query(query), expected)
+        self.assertEqual(self.db.query_many([query]), [expected])
+        self.assertEqual(sorted(self.db.stream(query)), expected)
+
+    def test_unknown_airline(self):
+        self.assertEqual(self.db.query(["PRINT-ALL", "?m1", "(MÁY_BAY ?m1 XX1)"]), "No results found")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import sys
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Models.metrics import Metrics
+
+class ConcurrentUpdateTest(unittest.TestCase):
+    """Counters and histograms updated from many threads lose no updates."""
+
+    THREADS = 8
+    UPDATES = 20000
+
+    def setUp(self):
+        self.interval = sys.getswitchinterval()
+        # Switch threads as often as possible so that unguarded read-modify-writes interleave
+        sys.setswitchinterval(1e-6)
+
+    def tearDown(self):
+        sys.setswitchinterval(self.interval)
+
+    def run_threads(self, target):
+        threads = [threading.Thread(target=target) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_counts_and_observations(self):
+        metrics = Metrics(enabled=True)
+
+        def update():
+            for i in range(self.UPDATES):
+                metrics.count("rows", label=i % 3)
+                metrics.observe("query", 1e-5)
+
+        self.run_threads(update)
+        total = self.THREADS * self.UPDATES
+        self.assertEqual(sum(metrics.counters.values()), total)
+        summary = metrics.to_json()["stages"]["query"]
+        self.assertEqual(summary["count"], total)
+        self.assertEqual(sum(metrics.histograms["query"].counts), total)
+
+if __name__ == "__main__":
+    unittest.main()
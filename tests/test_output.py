@@ -0,0 +1,65 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from main import OUTPUT_FILES, write_result
+from Models.logical import Argument, Predicate, Which
+from Models.output import open_writer, read_stream
+from Models.plan import Condition, QueryPlan
+
+QUESTION = "Máy bay nào hạ cánh ở Huế ?"
+RESULT = {
+    "tokens": ["máy bay", "hạ cánh", "ở", "Huế", "?"],
+    "dependencies": [("nsubj", "hạ cánh", "máy bay"), ("root", "root", "hạ cánh")],
+    "grammatical": [["PRED", "m1", "HẠ CÁNH"], ["TO-LOC", "m1", "HUẾ"]],
+    "logical": [Which("MÁY BAY", "m1"), Predicate("HẠ CÁNH", (Argument(None, "MÁY BAY"), Argument("TO-LOC", "HUẾ")), "m1")],
+    "procedural": QueryPlan("PRINT-ALL", ("?m1",), (Condition("ATIME", ("?m1", "HUE", "?t")),), None),
+}
+ANSWER = [("VJ1", "10:00HR"), ("VN1", "9:00HR")]
+
+class StreamRecordTest(unittest.TestCase):
+    """jsonl and binary streams hold each stage as a JSON value, not as the repr line of its text file."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, format):
+        with open_writer(self.directory, OUTPUT_FILES, format) as writer:
+            write_result(writer, QUESTION, RESULT, ANSWER)
+
+    def test_jsonl_record_is_json(self):
+        self.write("jsonl")
+        with open(os.path.join(self.directory, "results.jsonl"), encoding="utf-8") as f:
+            record = json.loads(f.readline())
+        self.assertEqual(record["question"], QUESTION)
+        self.assertEqual(record["tokens"], RESULT["tokens"])
+        self.assertEqual(record["dependencies"], ["nsubj(hạ cánh, máy bay)", "root(root, hạ cánh)"])
+        self.assertEqual(record["grammatical"], RESULT["grammatical"])
+        self.assertEqual(record["logical"], ["(m1 WHICH MÁY BAY)", "(m1 PRED HẠ CÁNH [MÁY BAY] [TO-LOC HUẾ])"])
+        self.assertEqual(record["procedural"], ["PRINT-ALL", "?m1", "(ATIME ?m1 HUE ?t)"])
+        self.assertEqual(record["answer"], [list(row) for row in ANSWER])
+
+    def test_binary_matches_jsonl(self):
+        self.write("jsonl")
+        self.write("binary")
+        self.assertEqual(list(read_stream(os.path.join(self.directory, "results.bin"))),
+                         list(read_stream(os.path.join(self.directory, "results.jsonl"))))
+
+    def test_text_lines_unchanged(self):
+        self.write("text")
+        with open(os.path.join(self.directory, "tokens.txt"), encoding="utf-8") as f:
+            self.assertEqual(f.read(), str(RESULT["tokens"]) + "\n")
+        with open(os.path.join(self.directory, "answers.txt"), encoding="utf-8") as f:
+            self.assertEqual(f.read(), str(ANSWER) + "\n")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import asyncio
+import json
+import os
+import sys
+import unittest
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Models.database import FlightDatabase
+from Models.server import QueryServer
+
+QUESTION = quote("Máy bay nào hạ cánh ở Huế ?")
+
+class RowsParametersTest(unittest.TestCase):
+    """/rows answers 400 for a negative or non-integer limit or offset instead of cutting the stream short."""
+
+    @classmethod
+    def setUpClass(cls):
+        database = os.path.join(ROOT, "input", "database.txt")
+        cls.server = QueryServer(FlightDatabase(database), database=database,
+                                 lexicon=os.path.join(ROOT, "input", "lexicon.txt"))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+
+    def get(self, target):
+        async def request():
+            server = await asyncio.start_server(self.server.handle, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(f"GET {target} HTTP/1.1\r\nConnection: close\r\n\r\n".encode("latin-1"))
+            await writer.drain()
+            data = await asyncio.wait_for(reader.read(), 30)
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return data
+
+        head, _, body = asyncio.run(request()).partition(b"\r\n\r\n")
+        return int(head.split()[1]), body
+
+    def test_negative_limit_and_offset(self):
+        for query in ("limit=-1", "offset=-1", "limit=2&offset=-3"):
+            with self.subTest(query=query):
+                status, body = self.get(f"/rows?q={QUESTION}&{query}")
+                self.assertEqual(status, 400)
+                self.assertEqual(json.loads(body), {"error": "limit and offset must not be negative"})
+
+    def test_non_integer_limit(self):
+        status, _ = self.get(f"/rows?q={QUESTION}&limit=two")
+        self.assertEqual(status, 400)
+
+    def test_limit(self):
+        status, body = self.get(f"/rows?q={QUESTION}&limit=1&offset=0")
+        self.assertEqual(status, 200)
+        # One chunk holding one JSON line, then the last chunk
+        self.assertTrue(body.endswith(b"\r\n0\r\n\r\n"))
+        self.assertEqual(len(body.split(b"\r\n")[1].splitlines()), 1)
+
+    def test_stream_rejects_negative_limit(self):
+        with self.assertRaises(ValueError):
+            self.server.db.stream(["PRINT-ALL", "?m", "(ATIME ?m HUE ?t)"], limit=-1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Models.database import FlightDatabase
+
+class CorruptSnapshotTest(unittest.TestCase):
+    """A truncated or corrupt snapshot is ignored and rebuilt from the text database."""
+
+    QUERY = ["PRINT-ALL", "?m", "?t", "(ATIME ?m HUE ?t)"]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "database.txt")
+        self.snapshot = os.path.join(self.directory, "database.snap")
+        shutil.copy(os.path.join(ROOT, "input", "database.txt"), self.path)
+        self.expected = FlightDatabase(self.path, snapshot=self.snapshot).query(self.QUERY)
+        with open(self.snapshot, "rb") as f:
+            self.data = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def open_with(self, data):
+        with open(self.snapshot, "wb") as f:
+            f.write(data)
+        # Keep the damaged snapshot newer than the text so that it is tried first
+        source = os.path.getmtime(self.path)
+        os.utime(self.snapshot, (source + 1, source + 1))
+        with contextlib.redirect_stdout(io.StringIO()):
+            return FlightDatabase(self.path, snapshot=self.snapshot)
+
+    def test_truncated(self):
+        for size in (0, 5, 100, len(self.data) // 2, len(self.data) - 1):
+            with self.subTest(size=size):
+                db = self.open_with(self.data[:size])
+                self.assertIsNone(db.mapped)
+                self.assertEqual(db.query(self.QUERY), self.expected)
+
+    def test_corrupt_header(self):
+        for data in (b"XXXX" + self.data[4:], self.data[:20] + b"\xff" + self.data[21:]):
+            db = self.open_with(data)
+            self.assertIsNone(db.mapped)
+            self.assertEqual(db.query(self.QUERY), self.expected)
+
+    def test_rebuilt(self):
+        self.open_with(self.data[:100])
+        db = FlightDatabase(self.path, snapshot=self.snapshot)
+        self.assertIsNotNone(db.mapped)
+        self.assertEqual(db.query(self.QUERY), self.expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Models.database import FlightDatabase
+from Models.watcher import DatabaseWatcher
+
+class RewriteTest(unittest.TestCase):
+    """A file seen mid-rewrite retracts nothing; the finished file is applied once it holds still."""
+
+    QUERY = ["PRINT-ALL", "?m", "?t", "(ATIME ?m HUE ?t)"]
+    FACT = "(ATIME VN9 HUE 23:00HR)"
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "database.txt")
+        shutil.copy(os.path.join(ROOT, "input", "database.txt"), self.path)
+        with open(self.path, encoding="utf-8") as f:
+            self.text = f.read()
+        self.db = FlightDatabase(self.path)
+        self.expected = self.db.query(self.QUERY)
+        self.watcher = DatabaseWatcher(self.db, self.path)
+        self.mtime = os.stat(self.path).st_mtime_ns
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, text, path=None):
+        with open(path or self.path, "w", encoding="utf-8") as f:
+            f.write(text)
+        # Every write gets its own mtime, however coarse the filesystem clock is
+        self.mtime += 1_000_000_000
+        os.utime(path or self.path, ns=(self.mtime, self.mtime))
+
+    def poll(self, times=2):
+        return [self.watcher.check() for _ in range(times)]
+
+    def test_truncated(self):
+        self.write("")
+        self.assertEqual(self.poll(1), [None])
+        self.write(self.text[:len(self.text) // 2])
+        self.assertEqual(self.poll(1), [None])
+        self.assertEqual(self.db.query(self.QUERY), self.expected)
+
+    def test_fact_cut_short(self):
+        self.write(self.text.rstrip("\n") + "\n" + self.FACT[:10])
+        self.assertEqual(self.poll(), [None, None])
+        self.assertEqual(self.db.query(self.QUERY), self.expected)
+
+    def test_finished_rewrite(self):
+        self.write("")
+        self.poll(1)
+        self.write(self.text.rstrip("\n") + "\n" + self.FACT + "\n")
+        version = self.poll()[-1]
+        self.assertIsNotNone(version)
+        self.assertEqual(self.db.query(self.QUERY), sorted(self.expected + [("VN9", "23:00HR")]))
+
+    def test_atomic_rename(self):
+        staged = os.path.join(self.directory, "database.new")
+        self.write(self.text.rstrip("\n") + "\n" + self.FACT + "\n", staged)
+        os.replace(staged, self.path)
+        self.assertIsNotNone(self.poll()[-1])
+        self.assertEqual(self.db.query(self.QUERY), sorted(self.expected + [("VN9", "23:00HR")]))
+
+if __name__ == "__main__":
+    unittest.main()